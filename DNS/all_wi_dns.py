@@ -1,45 +1,112 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+import dns.asyncresolver
 import dns.resolver
 import dns.rdatatype
-import whois
+import asyncio
+import json
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dns_cache import cache, MISSING
+from singleflight import SingleFlight
+from dnsnet.scan import read_domains, scan
+from dnsnet.dns_wire import EDNS_UDP_SIZE
+from whois_cache import lookup_creation_date
+from whois_scheduler import scheduler
+
+# Per-call deadlines in seconds
+DNS_TIMEOUT = 5.0
+WHOIS_TIMEOUT = 10.0
+REPORT_TIMEOUT = 10.0
+BULK_CONCURRENCY = 100
+SPOOL_MEMORY = 1 << 20
+# python-whois only has a blocking client, so its queries get a dedicated pool instead
+# of occupying the event loop or the default pool. Lookups wait for their registry's
+# rate limit (whois_scheduler) on the event loop, so a worker is only taken by a
+# query that is actually running.
+WHOIS_WORKERS = 32
 
 app = FastAPI()
+resolver = dns.asyncresolver.Resolver()
+resolver.lifetime = DNS_TIMEOUT
+resolver.use_edns(0, 0, EDNS_UDP_SIZE)
+whois_executor = ThreadPoolExecutor(max_workers=WHOIS_WORKERS, thread_name_prefix="whois")
+dns_flight = SingleFlight()
+whois_flight = SingleFlight()
+
+
+def negative_ttl(error):
+    # RFC 2308: negative answers live for min(SOA TTL, SOA MINIMUM) of the zone's SOA
+    if isinstance(error, dns.resolver.NXDOMAIN):
+        responses = error.responses().values()
+    else:
+        responses = [error.kwargs.get("response")]
+    for response in responses:
+        for rrset in getattr(response, "authority", []):
+            if rrset.rdtype == dns.rdatatype.SOA:
+                return min(rrset.ttl, rrset[0].minimum)
+    return None
 
-def get_domain_age(domain):
+
+async def query_upstream(domain, record_type):
     try:
-        domain_info = whois.whois(domain)
-        creation_date = domain_info.creation_date
-        if isinstance(creation_date, list):
-            creation_date = creation_date[0]
+        answer = await resolver.resolve(domain, record_type)
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer) as e:
+        cache.put_error(domain, record_type, e, negative_ttl(e))
+        raise
+    cache.put(domain, record_type, answer, answer.expiration - time.time())
+    return answer
+
 
-        return creation_date
+async def resolve(domain, record_type):
+    answer = cache.get(domain, record_type)
+    if answer is not MISSING:
+        return answer
+    # Concurrent misses for the same name share one upstream query
+    return await dns_flight.do(cache.key(domain, record_type), query_upstream, domain, record_type)
+
+async def get_domain_age(domain, deadline=None):
+    try:
+        return await lookup_creation_date(domain, deadline=deadline, executor=whois_executor)
     
     except Exception as e:
         return {"error": f"An error occurred: {str(e)}"}
 
 
-def get_dmarc_record(domain):
+async def fetch_domain_age(domain):
+    # The lookup gives up waiting for the registry's rate limit when we stop waiting for it
+    deadline = time.monotonic() + WHOIS_TIMEOUT
     try:
-        dmarc_domain = f'_dmarc.{domain}'
-        txt_records = dns.resolver.query(dmarc_domain, 'TXT')
-        
-        dmarc_records = []
-        for txt_record in txt_records:
-            for txt_string in txt_record.strings:
-                dmarc_records.append(txt_string)
-        
-        if dmarc_records:
-            return dmarc_records
-        else:
-            return "No DMARC record found for the domain."
+        return await asyncio.wait_for(get_domain_age(domain, deadline), WHOIS_TIMEOUT)
+    except asyncio.TimeoutError:
+        return {"error": f"WHOIS lookup timed out after {WHOIS_TIMEOUT} seconds"}
 
-    except Exception as e:
-        return f"An error occurred: {str(e)}"
+
+async def lookup_domain_age(domain):
+    return await whois_flight.do(domain.lower(), fetch_domain_age, domain)
+
+
+async def get_dmarc_record(domain):
+    # Lookup failures propagate, so /dmarc can report them as {"error": ...} like
+    # the other endpoints do
+    dmarc_domain = f'_dmarc.{domain}'
+    txt_records = await resolve(dmarc_domain, 'TXT')
+    
+    dmarc_records = []
+    for txt_record in txt_records:
+        # A record longer than 255 bytes is split into several strings
+        dmarc_records.append(b"".join(txt_record.strings).decode())
+    
+    if dmarc_records:
+        return dmarc_records
+    else:
+        return "No DMARC record found for the domain."
 
 @app.get("/name-servers/")
 async def get_name_servers(domain: str):
     try:
-        ns_records = dns.resolver.query(domain, 'NS')
+        ns_records = await resolve(domain, 'NS')
 
         ns_records_info = [ns.target.to_text() for ns in ns_records]
 
@@ -51,7 +118,7 @@ async def get_name_servers(domain: str):
 @app.get("/mx-records/")
 async def get_mx_records(domain: str):
     try:
-        mx_records = dns.resolver.query(domain, 'MX')
+        mx_records = await resolve(domain, 'MX')
         
 
         mx_records_info = [
@@ -69,8 +136,10 @@ async def get_mx_records(domain: str):
 
 @app.get("/dmarc")
 async def get_dmarc(domain:str):
-
-    dmarc_records = get_dmarc_record(domain)
+    try:
+        dmarc_records = await get_dmarc_record(domain)
+    except Exception as e:
+        return {"error": f"An error occurred: {str(e)}"}
 
     return{"dmarc_records": dmarc_records}
 
@@ -78,7 +147,7 @@ async def get_dmarc(domain:str):
 @app.get("/a-record")
 async def get_a_record(domain:str):
 
-    a_records = dns.resolver.query(domain, 'A')
+    a_records = await resolve(domain, 'A')
 
     a_records_info = [
             {
@@ -93,14 +162,15 @@ async def get_a_record(domain:str):
 async def get_spf_records(domain: str):
     try:
         # Perform a DNS TXT record query for SPF
-        txt_records = dns.resolver.query(domain, 'TXT')
+        txt_records = await resolve(domain, 'TXT')
         
         # Extract and format the SPF records
         spf_records_info = []
         for txt_record in txt_records:
-            for txt_string in txt_record.strings:
-                if txt_string.startswith(b"v=spf1 "):  # Encode the string as bytes
-                    spf_records_info.append(txt_string.decode())  # Decode the bytes to a string
+            # Records longer than 255 bytes are split into several strings
+            txt_string = b"".join(txt_record.strings)
+            if txt_string.startswith(b"v=spf1 "):  # Encode the string as bytes
+                spf_records_info.append(txt_string.decode())  # Decode the bytes to a string
         
         if spf_records_info:
             return {"domain": domain, "spf_records": spf_records_info}
@@ -112,8 +182,104 @@ async def get_spf_records(domain: str):
 
 @app.get("/age")
 async def get_age(domain:str):
-    age=get_domain_age(domain)
+    age=await lookup_domain_age(domain)
 
     return {"domain": domain, "domain_age": age}
 
 
+async def timed_section(lookup, timeout):
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(lookup, timeout)
+        # The endpoint handlers report their own failures as {"error": ...}
+        status = "error" if isinstance(result, dict) and "error" in result else "ok"
+    except asyncio.TimeoutError:
+        result = None
+        status = "timeout"
+    except Exception as e:
+        result = {"error": f"An error occurred: {str(e)}"}
+        status = "error"
+    return {
+        "status": status,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+        "result": result,
+    }
+
+
+@app.get("/domain-report")
+async def get_domain_report(domain: str, timeout: float = REPORT_TIMEOUT):
+    # All lookups run concurrently, so the report takes as long as the slowest one;
+    # a section that misses the deadline is reported as a timeout instead of failing the rest
+    sections = {
+        "a_record": get_a_record(domain),
+        "mx_records": get_mx_records(domain),
+        "name_servers": get_name_servers(domain),
+        "spf_records": get_spf_records(domain),
+        "dmarc": get_dmarc(domain),
+        "age": get_age(domain),
+    }
+    start = time.perf_counter()
+    results = await asyncio.gather(*(timed_section(lookup, timeout) for lookup in sections.values()))
+    return {
+        "domain": domain,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 2),
+        "sections": dict(zip(sections, results)),
+    }
+
+
+async def spool_domains(request):
+    # Domains one per line, either as a multipart upload in the "file" field or as the
+    # raw request body. The body is spooled to a temporary file first: it cannot be read
+    # any more once the streaming response has started, and a file keeps memory flat.
+    if request.headers.get("content-type", "").startswith("multipart/form-data"):
+        form = await request.form()
+        return form["file"].file
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+
+async def scan_domain(index, domain):
+    spf, dmarc, mx = await asyncio.gather(
+        get_spf_records(domain), get_dmarc(domain), get_mx_records(domain)
+    )
+    return {
+        "index": index,
+        "domain": domain,
+        "spf_records": spf.get("spf_records", spf),
+        "dmarc_records": dmarc.get("dmarc_records", dmarc),
+        "mx_records": mx.get("mx_records", mx),
+    }
+
+
+async def bulk_scan(domains, offset, concurrency):
+    # Each line is written out as soon as its domain is done, with the `resume_offset`
+    # a crashed scan restarts from
+    async for result in scan(domains, scan_domain, concurrency, offset):
+        yield json.dumps(result, default=str) + "\n"
+
+
+@app.post("/bulk-scan")
+async def post_bulk_scan(request: Request, offset: int = 0, concurrency: int = BULK_CONCURRENCY):
+    domains = read_domains(await spool_domains(request))
+    return StreamingResponse(
+        bulk_scan(domains, offset, max(1, concurrency)),
+        media_type="application/x-ndjson",
+    )
+
+
+@app.get("/cache-stats")
+async def get_cache_stats():
+    return cache.stats()
+
+
+@app.get("/coalescing-stats")
+async def get_coalescing_stats():
+    return {"dns": dns_flight.stats(), "whois": whois_flight.stats()}
+
+
+@app.get("/whois-stats")
+async def get_whois_stats():
+    return scheduler.stats()
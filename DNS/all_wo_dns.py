@@ -1,95 +1,94 @@
-import whois
-import socket
-import struct
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from dns_cache import cache, MISSING
+from dnsnet.dns_wire import parse_message, records, message_ttl, A, MX, TXT, NOERROR, NXDOMAIN
+from whois_cache import lookup_creation_date
+from whois_scheduler import scheduler
+from dnsnet.udp_pool import close_pools
+from dnsnet.tcp_pool import close_tcp_pools
+from upstreams import UpstreamSet
 
-app= FastAPI()
+# Upstream DNS servers (Google, Cloudflare, Quad9); each query goes to whichever is
+# currently fastest, with a hedged second query when it is slower than usual
+DNS_SERVERS = [("8.8.8.8", 53), ("1.1.1.1", 53), ("9.9.9.9", 53)]
+HEDGE = True
+# Set DNS_CAPTURE_FILE to a path to append every raw upstream response to it, each
+# prefixed with its 2-byte length (the corpus format of dns_corpus.py at the
+# repository root)
+CAPTURE_FILE = os.environ.get("DNS_CAPTURE_FILE")
+# python-whois blocks, so its queries run in their own pool with the same deadline
+# and size as in all_wi_dns; the per-registry wait (whois_scheduler) holds no worker
+WHOIS_TIMEOUT = 10.0
+WHOIS_WORKERS = 32
 
-def custom_dns_query(domain, record_type):
+capture = None
+capture_executor = None
+
+@asynccontextmanager
+async def lifespan(app):
+    global capture, capture_executor
+    if CAPTURE_FILE:
+        capture = open(CAPTURE_FILE, "ab")
+        # Writes go through one thread, in order, so a slow disk never stalls the loop
+        capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+    try:
+        yield
+    finally:
+        close_pools()
+        close_tcp_pools()
+        if capture is not None:
+            # Let the queued writes finish before closing the file
+            file, capture = capture, None
+            capture_executor.shutdown(wait=True)
+            file.close()
+
+app= FastAPI(lifespan=lifespan)
+upstreams = UpstreamSet(DNS_SERVERS, hedge=HEDGE)
+whois_executor = ThreadPoolExecutor(max_workers=WHOIS_WORKERS, thread_name_prefix="whois")
+
+async def custom_dns_query(domain, record_type):
+    result = cache.get(domain, record_type)
+    if result is not MISSING:
+        return result
     try:
-        # DNS server (Google Public DNS)
-        dns_server = "8.8.8.8"
-        dns_port = 53
-        
-        # Create a UDP socket for DNS queries
-        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        
-        # Build the DNS query packet
-        query_id = 12345
-        flags = 0b0000000100000000  # Standard query with recursion
-        questions = 1
-        answers = 0
-        authority_rrs = 0
-        additional_rrs = 0
-        
-        # DNS header
-        dns_header = struct.pack("!HHHHHHH", query_id, flags, questions, answers, authority_rrs, additional_rrs, 0)
-        
-        # Encode the domain name
-        domain_parts = domain.split(".")
-        dns_question = b"".join(struct.pack("B", len(label)) + label.encode("utf-8") for label in domain_parts)
-        dns_question += b"\x00"  # Null-terminated
-        
-        # DNS question section
-        dns_question += struct.pack("!HH", record_type, 1)  # Record type (A, MX, or SPF) and class (IN)
-        
-        # Combine header and question to create the DNS query packet
-        dns_query_packet = dns_header + dns_question
-        
-        # Send the query to the DNS server
-        udp_socket.sendto(dns_query_packet, (dns_server, dns_port))
-        
-        # Receive the DNS response
-        response, _ = udp_socket.recvfrom(1024)
-
-        # Debugging: Print the DNS response
-        print(response)
-        
-        # Parse the response based on record type
-        if record_type == 1:  # A record
-            return {"domain": domain, "a_records": socket.getaddrinfo(domain, 80)}
-        elif record_type == 15:  # MX record
-            mx_records = []
-            idx = 12  # Start parsing the response after the header
-            while idx < len(response):
-                priority, = struct.unpack("!H", response[idx:idx + 2])
-                idx += 2
-                mx_domain = response[idx:].split(b"\x00", 1)[0].decode("utf-8")
-                mx_records.append(f"{priority} {mx_domain}")
-                idx += len(mx_domain) + 1
-            return {"domain": domain, "mx_records": mx_records}
+        # SPF records are published as TXT (the SPF RR type 99 is obsolete), so that
+        # is what goes on the wire for record_type 99
+        wire_type = TXT if record_type == 99 else record_type
+        # Truncated (large TXT/SPF) answers are fetched again over TCP from the same server
+        response = await upstreams.query(domain, wire_type)
+        if capture is not None:
+            capture_executor.submit(capture.write, len(response).to_bytes(2, "big") + response)
+
+        message = parse_message(response)
+
+        if record_type == A:
+            result = {"domain": domain, "a_records": records(message, A)}
+        elif record_type == MX:
+            mx_records = [f"{mx['preference']} {mx['exchange']}" for mx in records(message, MX)]
+            result = {"domain": domain, "mx_records": mx_records}
         elif record_type == 99:  # SPF record (TXT record)
-            spf_records = []
-            # Search for TXT records (record type 16)
-            idx = 12  # Start parsing the response after the header
-            while idx < len(response):
-                record_type, record_data_len = struct.unpack("!HH", response[idx:idx + 4])
-                idx += 4
-                if record_type == 16:  # TXT record
-                    txt_data = response[idx:idx + record_data_len].decode("utf-8")
-                    if txt_data.startswith("v=spf1"):
-                        spf_records.append(txt_data)
-                idx += record_data_len
-
-            # Debugging: Print SPF records
-            print(spf_records)
-
-            return {"domain": domain, "spf_records": spf_records}
+            spf_records = [txt for txt in records(message, TXT) if txt.startswith("v=spf1")]
+            result = {"domain": domain, "spf_records": spf_records}
         else:
             return {"error": "Unsupported record type"}
 
+        # Only real answers are cached; a SERVFAIL/REFUSED says nothing about the name
+        if message["rcode"] in (NOERROR, NXDOMAIN):
+            cache.put(domain, record_type, result, message_ttl(message))
+        return result
+
     except Exception as e:
         return {"error": f"An error occurred: {str(e)}"}
 
 
-def get_creation_date(domain):
+async def get_creation_date(domain, deadline=None):
     try:
-        # Use the python-whois library to query and parse WHOIS data
-        domain_info = whois.whois(domain)
-        creation_date = domain_info.creation_date
-        if isinstance(creation_date, list):
-            creation_date = creation_date[0]
-        
+        # WHOIS data via python-whois, cached on disk and shared with all_wi_dns
+        creation_date = await lookup_creation_date(domain, deadline=deadline, executor=whois_executor)
         return {"domain": domain, "creation_date": creation_date}
     except Exception as e:
         return {"error": f"An error occurred: {str(e)}"}
@@ -99,13 +98,28 @@ async def query_dns(domain: str, record_type: int):
     if record_type not in {1, 15, 99}:
         return {"error": "Unsupported record type"}
     
-    result = custom_dns_query(domain, record_type)
+    result = await custom_dns_query(domain, record_type)
     return result
 
 @app.get("/creation-date/{domain}")
 async def query_creation_date(domain: str):
-    result = get_creation_date(domain)
-    return result
+    deadline = time.monotonic() + WHOIS_TIMEOUT
+    try:
+        return await asyncio.wait_for(get_creation_date(domain, deadline), WHOIS_TIMEOUT)
+    except asyncio.TimeoutError:
+        return {"error": f"WHOIS lookup timed out after {WHOIS_TIMEOUT} seconds"}
+
+@app.get("/cache-stats")
+async def get_cache_stats():
+    return cache.stats()
+
+@app.get("/whois-stats")
+async def get_whois_stats():
+    return scheduler.stats()
+
+@app.get("/upstream-stats")
+async def get_upstream_stats():
+    return upstreams.stats()
 
 
 
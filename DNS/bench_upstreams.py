@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import statistics
+import time
+from dnsnet import udp_pool
+from dnsnet.stub import start_stub_servers
+from upstreams import UpstreamSet
+
+
+async def latencies(query, requests, concurrency):
+    results = []
+    failed = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        nonlocal failed
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await query(f"host{i}.example.com", 1)
+            except Exception:
+                failed += 1
+                return
+            results.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return results, failed
+
+
+def report(label, results, failed):
+    results = sorted(results)
+    p50 = statistics.median(results) * 1000
+    p95 = results[int(len(results) * 0.95)] * 1000
+    p99 = results[int(len(results) * 0.99)] * 1000
+    print(f"{label:<24} p50={p50:7.2f} ms  p95={p95:7.2f} ms  p99={p99:7.2f} ms  failed={failed}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Single upstream vs. latency-ranked upstreams with hedging")
+    parser.add_argument("-n", "--requests", type=int, default=3000)
+    parser.add_argument("-c", "--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    servers = start_stub_servers([
+        # Usually the fastest, with occasional long stalls
+        {"delay": 0.002, "spike": 0.3, "spike_rate": 0.03},
+        # Steady but slower
+        {"delay": 0.008},
+        # Slow
+        {"delay": 0.040},
+        # Dead
+        {"delay": 0.0, "loss": 1.0},
+    ])
+    # Shorter timeout than the app's so the dead server is noticed quickly
+    for server in servers:
+        udp_pool.pools[server] = udp_pool.UDPPool(*server, timeout=0.5)
+
+    single = udp_pool.get_pool(*servers[0])
+    report("single upstream", *await latencies(single.query, args.requests, args.concurrency))
+    for hedge in (False, True):
+        upstreams = UpstreamSet(servers, hedge=hedge)
+        label = "ranked + hedging" if hedge else "ranked, no hedging"
+        report(label, *await latencies(upstreams.query, args.requests, args.concurrency))
+        stats = upstreams.stats()
+        shares = ", ".join(f"{u['server']}: {u['queries']}" for u in stats["upstreams"])
+        print(f"{'':<24} hedged={stats['hedged']} backup_wins={stats['backup_wins']}  queries per server: {shares}")
+    udp_pool.close_pools()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class DNSCache:
+    # In-process cache keyed by (name, record type). Entries expire after the TTL of the
+    # records they hold; errors such as NXDOMAIN/NODATA are cached too (negative caching)
+    # and re-raised on lookup. The least recently used entry is evicted when full.
+    def __init__(self, max_size=10000, max_ttl=86400, negative_ttl=300):
+        self.max_size = max_size
+        self.max_ttl = max_ttl
+        self.negative_ttl = negative_ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def key(name, record_type):
+        if isinstance(record_type, str):
+            record_type = record_type.upper()
+        return name.lower().rstrip("."), record_type
+
+    def get(self, name, record_type):
+        key = self.key(name, record_type)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return MISSING
+            expires, value, error = entry
+            if expires <= time.monotonic():
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return MISSING
+            self.entries.move_to_end(key)
+            self.hits += 1
+        if error:
+            # A fresh copy per hit: re-raising the cached instance would keep adding the
+            # frames of every lookup to its __traceback__ until the entry expires
+            raise copy.copy(value)
+        return value
+
+    def put(self, name, record_type, value, ttl):
+        # ttl=None means "no answer and no SOA to tell us how long", use the default
+        if ttl is None:
+            ttl = self.negative_ttl
+        self._store(self.key(name, record_type), value, ttl, False)
+
+    def put_error(self, name, record_type, error, ttl=None):
+        if ttl is None:
+            ttl = self.negative_ttl
+        self._store(self.key(name, record_type), error.with_traceback(None), ttl, True)
+
+    def _store(self, key, value, ttl, error):
+        ttl = min(ttl, self.max_ttl)
+        if ttl <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, value, error)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+# Shared by every endpoint of the app that imports it
+cache = DNSCache()
@@ -0,0 +1,3 @@
+# DNS wire format, socket pools and the bounded in-flight window, shared by the DNS
+# apps in this directory (`import dnsnet`) and the tools at the repository root
+# (`import DNS.dnsnet`). Modules here import each other relatively so both work.
@@ -0,0 +1,31 @@
+import asyncio
+
+
+async def as_completed_bounded(coroutines, limit):
+    # Runs coroutines pulled lazily from an iterable with at most `limit` pending and
+    # yields their results in completion order. Finished tasks are collected through a
+    # queue rather than asyncio.wait, which would re-register callbacks on every
+    # pending task after each completion.
+    coroutines = iter(coroutines)
+    finished = asyncio.Queue()
+    tasks = set()
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(tasks) < limit:
+                try:
+                    coroutine = next(coroutines)
+                except StopIteration:
+                    exhausted = True
+                    break
+                task = asyncio.ensure_future(coroutine)
+                task.add_done_callback(finished.put_nowait)
+                tasks.add(task)
+            if not tasks:
+                break
+            task = await finished.get()
+            tasks.discard(task)
+            yield task.result()
+    finally:
+        for task in tasks:
+            task.cancel()
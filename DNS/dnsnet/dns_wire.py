@@ -0,0 +1,207 @@
+import socket
+import struct
+
+# Record types this module decodes; anything else is returned as raw bytes
+A, NS, CNAME, SOA, PTR, MX, TXT, AAAA = 1, 2, 5, 6, 12, 15, 16, 28
+OPT = 41
+
+# Response codes
+NOERROR, SERVFAIL, NXDOMAIN, REFUSED = 0, 2, 3, 5
+
+# UDP payload size advertised through EDNS(0) (RFC 6891). 1232 bytes is the
+# size that avoids IP fragmentation on practically every path.
+EDNS_UDP_SIZE = 1232
+
+# Longest name on the wire, length octets included (RFC 1035 section 3.1)
+MAX_NAME_LENGTH = 255
+
+
+class MalformedMessage(ValueError):
+    pass
+
+
+def encode_name(domain):
+    # Length-prefixed labels, null-terminated
+    labels = domain.rstrip(".").split(".")
+    return b"".join(struct.pack("B", len(label)) + label.encode("utf-8") for label in labels) + b"\x00"
+
+
+def opt_record(udp_size):
+    # Root owner name, TYPE OPT, CLASS = UDP payload size, TTL 0 (extended RCODE 0,
+    # version 0, DO bit clear), no options
+    return b"\x00" + struct.pack("!HHIH", OPT, udp_size, 0, 0)
+
+
+def build_query(query_id, domain, rr_type, udp_size=EDNS_UDP_SIZE):
+    flags = 0b0000000100000000  # Standard query with recursion
+    # ID, flags, one question, no answer/authority records; the OPT record, if any,
+    # is the only additional record. udp_size=None sends a plain pre-EDNS query.
+    header = struct.pack("!HHHHHH", query_id, flags, 1, 0, 0, 1 if udp_size else 0)
+    question = encode_name(domain) + struct.pack("!HH", rr_type, 1)  # Class IN
+    return header + question + (opt_record(udp_size) if udp_size else b"")
+
+
+def is_truncated(response):
+    # TC bit: the answer did not fit in the UDP datagram and has to be fetched over TCP
+    return len(response) >= 3 and bool(response[2] & 0x02)
+
+
+def response_code(response):
+    # RCODE from the header, without the extended bits of an OPT record
+    return response[3] & 0xF if len(response) >= 4 else None
+
+
+def read_name(response, idx, names=None):
+    # Decodes a possibly compressed name at idx and returns it together with the
+    # offset of the first byte after it in the original position. Pointers may only
+    # refer backwards and a name is at most MAX_NAME_LENGTH bytes, so a crafted
+    # message cannot loop or nest forever. Given a `names` dict, every suffix decoded
+    # on the way is cached in it by offset, so names sharing a suffix through
+    # compression decode it once.
+    offsets = []
+    labels = []
+    suffix = ""
+    end = None
+    size = 1
+    try:
+        while True:
+            start = idx
+            length = response[idx]
+            while 0 < length < 0x40:
+                offsets.append(idx)
+                labels.append(response[idx + 1:idx + 1 + length])
+                idx += length + 1
+                length = response[idx]
+            size += idx - start
+            if size > MAX_NAME_LENGTH:
+                raise MalformedMessage("Name longer than 255 bytes")
+            if end is None:
+                end = idx + (2 if length else 1)
+            if length == 0:
+                break
+            if length < 0xC0:
+                raise MalformedMessage("Invalid label length")
+            # Compression pointer, 14-bit offset
+            target = ((length & 0x3F) << 8) | response[idx + 1]
+            if target >= start:
+                raise MalformedMessage("Compression pointer does not point backwards")
+            if names is not None and target in names:
+                suffix = names[target]
+                break
+            idx = target
+    except IndexError:
+        raise MalformedMessage("Name runs past the end of the message") from None
+    if names is None:
+        return b".".join(labels).decode(), end
+    for offset, label in zip(reversed(offsets), reversed(labels)):
+        label = label.decode()
+        suffix = f"{label}.{suffix}" if suffix else label
+        names[offset] = suffix
+    return suffix, end
+
+
+def read_rdata(response, rr_type, idx, rdlength):
+    end = idx + rdlength
+    if rr_type == A and rdlength == 4:
+        return socket.inet_ntop(socket.AF_INET, response[idx:end])
+    if rr_type == AAAA and rdlength == 16:
+        return socket.inet_ntop(socket.AF_INET6, response[idx:end])
+    if rr_type in (NS, CNAME, PTR):
+        return read_name(response, idx)[0]
+    if rr_type == MX:
+        preference, = struct.unpack("!H", response[idx:idx + 2])
+        return {"preference": preference, "exchange": read_name(response, idx + 2)[0]}
+    if rr_type == TXT:
+        # One or more <length><text> character-strings, concatenated
+        strings = []
+        while idx < end:
+            length = response[idx]
+            strings.append(response[idx + 1:idx + 1 + length])
+            idx += length + 1
+        return b"".join(strings).decode("utf-8", errors="replace")
+    if rr_type == OPT:
+        # Option code/length/value triples (e.g. NSID, cookies)
+        options = []
+        while idx + 4 <= end:
+            code, length = struct.unpack("!HH", response[idx:idx + 4])
+            options.append({"code": code, "data": response[idx + 4:idx + 4 + length]})
+            idx += 4 + length
+        return options
+    if rr_type == SOA:
+        mname, idx = read_name(response, idx)
+        rname, idx = read_name(response, idx)
+        serial, refresh, retry, expire, minimum = struct.unpack("!IIIII", response[idx:idx + 20])
+        return {
+            "mname": mname, "rname": rname, "serial": serial, "refresh": refresh,
+            "retry": retry, "expire": expire, "minimum": minimum,
+        }
+    return response[idx:end]
+
+
+def parse_message(response):
+    # Single pass over the whole message: header, question section, then every
+    # answer, authority and additional record
+    if len(response) < 12:
+        raise MalformedMessage("Message shorter than the DNS header")
+    query_id, flags, qdcount, ancount, nscount, arcount = struct.unpack("!HHHHHH", response[:12])
+    message = {
+        "id": query_id,
+        "flags": flags,
+        "rcode": flags & 0xF,
+        "truncated": bool(flags & 0x0200),
+        "questions": [],
+        "answers": [],
+        "authority": [],
+        "additional": [],
+    }
+    idx = 12
+    for _ in range(qdcount):
+        name, idx = read_name(response, idx)
+        qtype, qclass = struct.unpack("!HH", response[idx:idx + 4])
+        idx += 4
+        message["questions"].append({"name": name, "type": qtype, "class": qclass})
+    for section, count in (("answers", ancount), ("authority", nscount), ("additional", arcount)):
+        for _ in range(count):
+            name, idx = read_name(response, idx)
+            if idx + 10 > len(response):
+                raise MalformedMessage("Record header runs past the end of the message")
+            rr_type, rr_class, ttl, rdlength = struct.unpack("!HHIH", response[idx:idx + 10])
+            idx += 10
+            if idx + rdlength > len(response):
+                raise MalformedMessage("Record data runs past the end of the message")
+            message[section].append({
+                "name": name,
+                "type": rr_type,
+                "class": rr_class,
+                "ttl": ttl,
+                "data": read_rdata(response, rr_type, idx, rdlength),
+            })
+            idx += rdlength
+    for record in message["additional"]:
+        if record["type"] == OPT:
+            # EDNS(0): CLASS is the server's UDP payload size, TTL holds the upper
+            # 8 bits of the RCODE, the EDNS version and the DO flag
+            message["rcode"] |= (record["ttl"] >> 24) << 4
+            message["edns"] = {
+                "udp_size": record["class"],
+                "version": (record["ttl"] >> 16) & 0xFF,
+                "dnssec_ok": bool(record["ttl"] & 0x8000),
+                "options": record["data"],
+            }
+            break
+    return message
+
+
+def records(message, rr_type):
+    return [record["data"] for record in message["answers"] if record["type"] == rr_type]
+
+
+def message_ttl(message):
+    # Smallest TTL among the answers, or for an empty/NXDOMAIN answer the negative
+    # caching TTL from the SOA in the authority section (None if there is none)
+    if message["answers"]:
+        return min(record["ttl"] for record in message["answers"])
+    for record in message["authority"]:
+        if record["type"] == SOA:
+            return min(record["ttl"], record["data"]["minimum"])
+    return None
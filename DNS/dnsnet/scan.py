@@ -0,0 +1,32 @@
+import itertools
+from .bounded import as_completed_bounded
+
+
+def read_domains(lines):
+    # One domain per line (str or bytes); blank lines and # comments are skipped
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode()
+        domain = line.strip().rstrip(".").lower()
+        if domain and not domain.startswith("#"):
+            yield domain
+
+
+async def scan(domains, scan_domain, concurrency, offset=0):
+    # Runs scan_domain(index, domain) for the domains from `offset` on, at most
+    # `concurrency` at once, and yields the result dicts as they complete. They arrive
+    # out of order, so each gets `resume_offset`: every domain before that index has
+    # already been yielded, which is where a crashed scan restarts.
+    done = set()
+    watermark = offset
+    jobs = (
+        scan_domain(index, domain)
+        for index, domain in enumerate(itertools.islice(domains, offset, None), offset)
+    )
+    async for result in as_completed_bounded(jobs, concurrency):
+        done.add(result["index"])
+        while watermark in done:
+            done.remove(watermark)
+            watermark += 1
+        result["resume_offset"] = watermark
+        yield result
@@ -0,0 +1,62 @@
+import asyncio
+import random
+import socket
+import struct
+import threading
+
+# Large kernel buffer so the stub does not drop a benchmark's bursts itself
+RECV_BUFFER = 1 << 20
+
+
+class StubServer(asyncio.DatagramProtocol):
+    # Answers every query with a single A record (10.0.0.1, TTL 1) for load tests and
+    # benchmarks. Replies wait `delay` seconds; a `spike_rate` share of queries waits
+    # `spike` seconds instead and a `loss` share is never answered.
+    def __init__(self, delay=0.0, spike=0.0, spike_rate=0.0, loss=0.0):
+        self.delay = delay
+        self.spike = spike
+        self.spike_rate = spike_rate
+        self.loss = loss
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        transport.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER)
+
+    def datagram_received(self, data, addr):
+        if self.loss and random.random() < self.loss:
+            return
+        end = data.index(0, 12) + 5
+        header = data[:2] + struct.pack("!HHHHH", 0x8180, 1, 1, 0, 0)
+        answer = b"\xc0\x0c" + struct.pack("!HHIH", 1, 1, 1, 4) + bytes([10, 0, 0, 1])
+        reply = header + data[12:end] + answer
+        delay = self.spike if self.spike_rate and random.random() < self.spike_rate else self.delay
+        if delay:
+            asyncio.get_running_loop().call_later(delay, self.transport.sendto, reply, addr)
+        else:
+            self.transport.sendto(reply, addr)
+
+
+def start_stub_servers(profiles):
+    # One StubServer per profile (its keyword arguments), all on one event loop in a
+    # thread of their own so they do not compete with the client being measured.
+    # Returns their (host, port) addresses.
+    loop = asyncio.new_event_loop()
+    ready = threading.Event()
+    ports = []
+
+    async def serve():
+        for profile in profiles:
+            transport, _ = await loop.create_datagram_endpoint(
+                lambda: StubServer(**profile), local_addr=("127.0.0.1", 0)
+            )
+            ports.append(transport.get_extra_info("sockname")[1])
+        ready.set()
+
+    def run():
+        loop.run_until_complete(serve())
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    ready.wait()
+    return [("127.0.0.1", port) for port in ports]
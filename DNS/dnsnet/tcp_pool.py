@@ -0,0 +1,119 @@
+import asyncio
+import random
+import struct
+from .dns_wire import build_query
+
+CONNECTIONS = 2
+# Queries outstanding on one connection before another connection is opened
+MAX_PIPELINED = 32
+TIMEOUT = 5.0
+
+
+class PipelinedConnection:
+    # One persistent DNS-over-TCP connection (RFC 7766). Several queries can be
+    # outstanding at once; responses may come back in any order and are matched
+    # to their caller by transaction ID.
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = {}
+        self.closed = False
+        self.reader_task = asyncio.ensure_future(self.read_responses())
+
+    async def read_responses(self):
+        try:
+            while True:
+                length, = struct.unpack("!H", await self.reader.readexactly(2))
+                response = await self.reader.readexactly(length)
+                future = self.pending.pop(response[:2], None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except (asyncio.IncompleteReadError, ConnectionError, OSError):
+            # The server closed the connection (idle timeout etc.)
+            pass
+        finally:
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.writer.close()
+        self.reader_task.cancel()
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("DNS TCP connection closed"))
+        self.pending.clear()
+
+    async def exchange(self, packet, timeout):
+        while packet[:2] in self.pending:
+            packet = random.randbytes(2) + packet[2:]
+        key = packet[:2]
+        future = asyncio.get_running_loop().create_future()
+        self.pending[key] = future
+        try:
+            self.writer.write(struct.pack("!H", len(packet)) + packet)
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self.pending.pop(key, None)
+
+
+class TCPPool:
+    def __init__(self, server, port=53, connections=CONNECTIONS, max_pipelined=MAX_PIPELINED, timeout=TIMEOUT):
+        self.server = server
+        self.port = port
+        self.max_connections = connections
+        self.max_pipelined = max_pipelined
+        self.timeout = timeout
+        self.connections = []
+        self.lock = asyncio.Lock()
+
+    async def connection(self):
+        async with self.lock:
+            self.connections = [c for c in self.connections if not c.closed]
+            least_busy = min(self.connections, key=lambda c: len(c.pending), default=None)
+            if least_busy is not None and (
+                len(least_busy.pending) < self.max_pipelined or len(self.connections) >= self.max_connections
+            ):
+                return least_busy
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.server, self.port), self.timeout
+            )
+            connection = PipelinedConnection(reader, writer)
+            self.connections.append(connection)
+            return connection
+
+    async def query(self, domain, rr_type):
+        return await self.request(build_query(random.getrandbits(16), domain, rr_type))
+
+    async def request(self, packet):
+        # Sends an already encoded query, e.g. one whose UDP answer was truncated. A
+        # reused connection may have been closed by the server in the meantime, so a
+        # query that fails that way gets one more try on a fresh connection.
+        for attempt in range(2):
+            connection = await self.connection()
+            try:
+                return await connection.exchange(packet, self.timeout)
+            except ConnectionError:
+                if attempt:
+                    raise
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+        self.connections = []
+
+
+tcp_pools = {}
+
+
+def get_tcp_pool(server, port=53):
+    if (server, port) not in tcp_pools:
+        tcp_pools[(server, port)] = TCPPool(server, port)
+    return tcp_pools[(server, port)]
+
+
+def close_tcp_pools():
+    for pool in tcp_pools.values():
+        pool.close()
+    tcp_pools.clear()
@@ -0,0 +1,136 @@
+import asyncio
+import itertools
+import random
+import socket
+from .dns_wire import build_query
+
+POOL_SIZE = 4
+TIMEOUT = 2.0
+RETRIES = 1
+# Queries beyond this wait for a free slot instead of all hitting the wire at once
+MAX_IN_FLIGHT = 512
+
+
+class UpstreamProtocol(asyncio.DatagramProtocol):
+    def __init__(self, pool):
+        self.pool = pool
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.pool.response_received(self, data)
+
+    def error_received(self, exc):
+        # e.g. ICMP port unreachable; the waiting query times out and is retried
+        pass
+
+
+class UDPPool:
+    # A few long-lived UDP sockets connected to one upstream resolver. Every query
+    # gets a random transaction ID and responses are routed back to the waiting
+    # caller by (socket, ID) after checking that the question is echoed back.
+    # `recv_buffer` enlarges the kernel receive buffer of each socket, so bursts of
+    # replies are not dropped before the loop reads them.
+    def __init__(self, server, port=53, size=POOL_SIZE, timeout=TIMEOUT, retries=RETRIES,
+                 max_in_flight=MAX_IN_FLIGHT, recv_buffer=None):
+        self.server = server
+        self.port = port
+        self.size = size
+        self.timeout = timeout
+        self.retries = retries
+        self.recv_buffer = recv_buffer
+        self.protocols = []
+        self.cycle = None
+        self.pending = {}
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.opening = None
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        protocols = []
+        for _ in range(self.size):
+            _, protocol = await loop.create_datagram_endpoint(
+                lambda: UpstreamProtocol(self), remote_addr=(self.server, self.port)
+            )
+            if self.recv_buffer:
+                protocol.transport.get_extra_info("socket").setsockopt(
+                    socket.SOL_SOCKET, socket.SO_RCVBUF, self.recv_buffer
+                )
+            protocols.append(protocol)
+        self.protocols = protocols
+        self.cycle = itertools.cycle(protocols)
+
+    async def ensure_open(self):
+        if not self.protocols:
+            # Concurrent first queries share one open() instead of each creating sockets
+            if self.opening is None:
+                self.opening = asyncio.ensure_future(self.open())
+            try:
+                await self.opening
+            finally:
+                self.opening = None
+
+    def close(self):
+        for protocol in self.protocols:
+            protocol.transport.close()
+        self.protocols = []
+        for future, _ in self.pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("Socket pool closed"))
+        self.pending.clear()
+
+    def response_received(self, protocol, response):
+        if len(response) < 12:
+            return
+        entry = self.pending.get((protocol, response[:2]))
+        if entry is None:
+            return
+        future, question = entry
+        if response[12:12 + len(question)].lower() != question.lower() or future.done():
+            return
+        future.set_result(response)
+
+    async def query(self, domain, rr_type):
+        return await self.request(build_query(random.getrandbits(16), domain, rr_type))
+
+    async def request(self, packet):
+        # Sends an already encoded query; its ID is replaced if it is in use
+        await self.ensure_open()
+        async with self.slots:
+            return await self.exchange(packet)
+
+    async def exchange(self, packet):
+        protocol = next(self.cycle)
+        while (protocol, packet[:2]) in self.pending:
+            packet = random.randbytes(2) + packet[2:]
+        key = (protocol, packet[:2])
+        future = asyncio.get_running_loop().create_future()
+        # Match on the question only; the OPT record after it is not echoed back
+        self.pending[key] = (future, packet[12:packet.index(0, 12) + 5])
+        try:
+            for _ in range(self.retries + 1):
+                protocol.transport.sendto(packet)
+                done, _ = await asyncio.wait((future,), timeout=self.timeout)
+                if done:
+                    return future.result()
+        finally:
+            # close() may already have cleared it
+            self.pending.pop(key, None)
+        raise TimeoutError(f"No response from {self.server} after {self.retries + 1} attempts")
+
+
+pools = {}
+
+
+def get_pool(server, port=53):
+    if (server, port) not in pools:
+        pools[(server, port)] = UDPPool(server, port)
+    return pools[(server, port)]
+
+
+def close_pools():
+    for pool in pools.values():
+        pool.close()
+    pools.clear()
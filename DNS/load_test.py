@@ -0,0 +1,73 @@
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+import whois
+import all_wi_dns
+import whois_cache
+from dnsnet.stub import start_stub_servers
+
+
+def slow_whois(delay):
+    def whois(domain):
+        time.sleep(delay)
+        raise Exception("simulated slow WHOIS server")
+    return whois
+
+
+async def a_record_latencies(client, requests, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.get("/a-record", params={"domain": f"host{i}.example.com"})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies
+
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{label:<28} n={len(latencies):<6} p50={p50:7.2f} ms  p99={p99:7.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Latency of /a-record with and without slow /age calls")
+    parser.add_argument("-n", "--requests", type=int, default=2000)
+    parser.add_argument("-c", "--concurrency", type=int, default=50)
+    parser.add_argument("--age-calls", type=int, default=100)
+    parser.add_argument("--whois-delay", type=float, default=3.0)
+    args = parser.parse_args()
+
+    # Point the app at a local stub resolver and a WHOIS client that hangs
+    host, port = start_stub_servers([{}])[0]
+    all_wi_dns.resolver.nameservers = [host]
+    all_wi_dns.resolver.port = port
+    whois.whois = slow_whois(args.whois_delay)
+    whois_cache.whois_cache = whois_cache.WhoisCache(":memory:")
+
+    transport = httpx.ASGITransport(app=all_wi_dns.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        report("/a-record alone", await a_record_latencies(client, args.requests, args.concurrency))
+        all_wi_dns.cache.clear()
+
+        age_calls = [
+            asyncio.ensure_future(client.get("/age", params={"domain": f"slow{i}.example.com"}))
+            for i in range(args.age_calls)
+        ]
+        await asyncio.sleep(0.1)
+        report("/a-record during slow /age", await a_record_latencies(client, args.requests, args.concurrency))
+        start = time.perf_counter()
+        await asyncio.gather(*age_calls)
+        print(f"{args.age_calls} /age calls finished {time.perf_counter() - start:.1f}s after the /a-record run")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
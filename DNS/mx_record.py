@@ -1,5 +1,6 @@
 import socket
 import struct
+from dnsnet.dns_wire import parse_message, records, MX
 
 def custom_dns_query(domain, record_type):
     try:
@@ -19,7 +20,7 @@ def custom_dns_query(domain, record_type):
         additional_rrs = 0
         
         # DNS header
-        dns_header = struct.pack("!HHHHHHH", query_id, flags, questions, answers, authority_rrs, additional_rrs, 0)
+        dns_header = struct.pack("!HHHHHH", query_id, flags, questions, answers, authority_rrs, additional_rrs)
         
         # Encode the domain name
         domain_parts = domain.split(".")
@@ -37,19 +38,9 @@ def custom_dns_query(domain, record_type):
         
         # Receive the DNS response
         response, _ = udp_socket.recvfrom(1024)
-        print(response)
         # Parse the response based on record type
-        if record_type == 15:  # MX record
-            mx_records = []
-            idx = 12  # Start parsing the response after the header
-            while idx < len(response):
-                priority, = struct.unpack("!H", response[idx:idx + 2])
-                idx += 2
-                mx_domain_len = response[idx]
-                idx += 1
-                mx_domain = response[idx:idx + mx_domain_len].decode("utf-8")
-                idx += mx_domain_len
-                mx_records.append((priority, mx_domain))
+        if record_type == MX:
+            mx_records = [(mx["preference"], mx["exchange"]) for mx in records(parse_message(response), MX)]
             return {"domain": domain, "mx_records": mx_records}
         else:
             return {"error": "Unsupported record type"}
@@ -0,0 +1,36 @@
+import asyncio
+
+
+class SingleFlight:
+    # Concurrent calls with the same key share one in-flight task: the first caller
+    # starts it, everyone else awaits the same result (or exception).
+    def __init__(self):
+        self.calls = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key, fn, *args):
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn(*args))
+            self.calls[key] = task
+            task.add_done_callback(lambda done: self.forget(key, done))
+            self.started += 1
+        else:
+            self.coalesced += 1
+        # shield() so one caller going away (client disconnect) does not cancel the
+        # lookup for everybody else waiting on it
+        return await asyncio.shield(task)
+
+    def forget(self, key, task):
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            task.exception()  # Mark as retrieved even if every waiter was cancelled
+
+    def stats(self):
+        return {
+            "in_flight": len(self.calls),
+            "started": self.started,
+            "coalesced": self.coalesced,
+        }
@@ -0,0 +1,182 @@
+import asyncio
+import random
+import time
+from collections import deque
+from dnsnet.dns_wire import is_truncated, response_code, SERVFAIL, REFUSED
+from dnsnet.udp_pool import get_pool
+from dnsnet.tcp_pool import get_tcp_pool
+
+# Smoothing factor for the round-trip estimate, as in TCP's SRTT (RFC 6298)
+RTT_ALPHA = 0.125
+# Recent round trips kept per server for the p95 hedging delay
+RTT_SAMPLES = 200
+# Until a server has this many samples its p95 is guessed from the SRTT
+MIN_SAMPLES = 20
+# Hedging never fires sooner than this, so a fast server is not doubled up on
+MIN_HEDGE_DELAY = 0.005
+# Hedging delay until some server has answered
+INITIAL_HEDGE_DELAY = 0.1
+# Consecutive-ish failures (the score halves on every success) before a server is
+# taken out of rotation, and how long it stays out at first and at most
+FAILURE_THRESHOLD = 3
+BACKOFF = 1.0
+MAX_BACKOFF = 60.0
+# Share of queries sent to a random healthy server first, so a server that was slow
+# once gets measured again instead of being ranked last forever
+PROBE_RATE = 0.02
+
+
+class UpstreamFailure(Exception):
+    # The server answered, but only to say it could not resolve the name
+    pass
+
+
+class Upstream:
+    def __init__(self, server, port=53):
+        self.server = server
+        self.port = port
+        self.srtt = None
+        self.samples = deque(maxlen=RTT_SAMPLES)
+        self.failure_score = 0.0
+        self.down_until = 0.0
+        self.queries = 0
+        self.failures = 0
+
+    def record_rtt(self, rtt):
+        self.srtt = rtt if self.srtt is None else self.srtt + (rtt - self.srtt) * RTT_ALPHA
+        self.samples.append(rtt)
+
+    def record_success(self, rtt):
+        self.queries += 1
+        self.record_rtt(rtt)
+        self.failure_score /= 2
+        self.down_until = 0.0
+
+    def record_failure(self, rtt):
+        # A failure costs its caller the time it took (the whole timeout for a server
+        # that never answers), so it goes into the estimate like any round trip
+        self.queries += 1
+        self.failures += 1
+        self.record_rtt(rtt)
+        self.failure_score += 1
+        if self.failure_score >= FAILURE_THRESHOLD:
+            backoff = BACKOFF * 2 ** (self.failure_score - FAILURE_THRESHOLD)
+            self.down_until = time.monotonic() + min(MAX_BACKOFF, backoff)
+
+    def healthy(self, now):
+        return now >= self.down_until
+
+    def score(self):
+        # Expected latency inflated by recent failures; an untried server scores 0
+        # so it gets measured straight away, a failed one scores at least its timeout
+        return (self.srtt or 0.0) * (1 + self.failure_score)
+
+    def p95(self):
+        if len(self.samples) < MIN_SAMPLES:
+            return None if self.srtt is None else self.srtt * 2
+        return sorted(self.samples)[int(len(self.samples) * 0.95)]
+
+    def stats(self):
+        return {
+            "server": f"{self.server}:{self.port}",
+            "srtt_ms": None if self.srtt is None else round(self.srtt * 1000, 2),
+            "p95_ms": None if self.p95() is None else round(self.p95() * 1000, 2),
+            "failure_score": round(self.failure_score, 2),
+            "healthy": self.healthy(time.monotonic()),
+            "queries": self.queries,
+            "failures": self.failures,
+        }
+
+
+class UpstreamSet:
+    # Sends each query to the currently fastest healthy upstream. With hedging on, a
+    # second copy goes to the next-best server once the first has been silent for
+    # longer than the best server's p95, and whichever answers first wins. A server that errors,
+    # times out or answers SERVFAIL/REFUSED is failed over from immediately.
+    def __init__(self, servers, hedge=True):
+        self.upstreams = [Upstream(server, port) for server, port in servers]
+        self.hedge = hedge
+        self.hedged = 0
+        # Answers that came from a hedge or failover query rather than the first choice
+        self.backup_wins = 0
+
+    def ranked(self):
+        now = time.monotonic()
+        healthy = sorted((u for u in self.upstreams if u.healthy(now)), key=Upstream.score)
+        # Servers in backoff are still tried, last, rather than failing outright
+        down = sorted((u for u in self.upstreams if not u.healthy(now)), key=lambda u: u.down_until)
+        if len(healthy) > 1 and random.random() < PROBE_RATE:
+            healthy.insert(0, healthy.pop(random.randrange(1, len(healthy))))
+        return healthy + down
+
+    def hedge_delay(self):
+        # Probes and servers that have been slow lately are hedged just as early as
+        # the best server would be, rather than after their own (larger) p95
+        p95s = [p95 for p95 in (u.p95() for u in self.upstreams) if p95 is not None]
+        return max(MIN_HEDGE_DELAY, min(p95s)) if p95s else INITIAL_HEDGE_DELAY
+
+    async def attempt(self, upstream, domain, rr_type):
+        start = time.perf_counter()
+        try:
+            response = await get_pool(upstream.server, upstream.port).query(domain, rr_type)
+        except asyncio.CancelledError:
+            # Lost a hedging race: the real round trip is at least this long. Without
+            # this a server that never answers would keep its score and stay first.
+            upstream.queries += 1
+            upstream.record_rtt(time.perf_counter() - start)
+            raise
+        except Exception:
+            upstream.record_failure(time.perf_counter() - start)
+            raise
+        rcode = response_code(response)
+        if rcode in (SERVFAIL, REFUSED):
+            # Another upstream may well have the answer, so this counts against the server
+            upstream.record_failure(time.perf_counter() - start)
+            raise UpstreamFailure(
+                f"{upstream.server} answered {'SERVFAIL' if rcode == SERVFAIL else 'REFUSED'} for {domain}"
+            )
+        upstream.record_success(time.perf_counter() - start)
+        return upstream, response
+
+    async def exchange(self, domain, rr_type):
+        candidates = self.ranked()
+        primary = candidates.pop(0)
+        pending = {asyncio.ensure_future(self.attempt(primary, domain, rr_type))}
+        delay = None
+        if self.hedge and candidates:
+            delay = self.hedge_delay()
+        error = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=delay, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        upstream, response = task.result()
+                        if upstream is not primary:
+                            self.backup_wins += 1
+                        return upstream, response
+                    error = task.exception()
+                if not done:
+                    # Primary is slower than usual: hedge once, then just wait
+                    self.hedged += 1
+                    delay = None
+                if candidates and (not done or not pending):
+                    pending.add(asyncio.ensure_future(self.attempt(candidates.pop(0), domain, rr_type)))
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
+
+    async def query(self, domain, rr_type):
+        upstream, response = await self.exchange(domain, rr_type)
+        if is_truncated(response):
+            # Ask the server that answered again over a persistent TCP connection
+            response = await get_tcp_pool(upstream.server, upstream.port).query(domain, rr_type)
+        return response
+
+    def stats(self):
+        return {
+            "hedged": self.hedged,
+            "backup_wins": self.backup_wins,
+            "upstreams": [upstream.stats() for upstream in self.upstreams],
+        }
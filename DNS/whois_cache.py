@@ -0,0 +1,150 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from whois_scheduler import scheduler, WhoisThrottled
+
+# Both apps live in this directory, so they share one database file
+WHOIS_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "whois_cache.sqlite3")
+# A creation date practically never changes, recheck it once a month
+MAX_AGE = 30 * 86400
+# Unregistered domains and failed lookups are retried much sooner
+NEGATIVE_TTL = 3600
+ERROR_TTL = 300
+# What registries send instead of the record when they are queried too often
+THROTTLE_REPLIES = ("limit exceeded", "rate limit", "too many queries", "too many requests", "try again later")
+
+FOUND = "found"
+NOT_FOUND = "not_found"
+ERROR = "error"
+
+
+class WhoisLookupError(Exception):
+    pass
+
+
+class WhoisCache:
+    def __init__(self, path=WHOIS_CACHE_PATH, max_age=MAX_AGE, negative_ttl=NEGATIVE_TTL, error_ttl=ERROR_TTL):
+        self.path = path
+        self.ttls = {FOUND: max_age, NOT_FOUND: negative_ttl, ERROR: error_ttl}
+        self.lock = threading.Lock()
+        # Opened on first use, so importing the apps does not touch the disk
+        self.connection = None
+
+    def connect(self):
+        # Called with the lock held. One connection is shared behind the lock, so the
+        # cache can be used from any thread.
+        if self.connection is None:
+            connection = sqlite3.connect(self.path, check_same_thread=False, timeout=10)
+            with connection:
+                # WAL lets the other app read while this one writes
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS whois_cache ("
+                    " domain TEXT PRIMARY KEY,"
+                    " status TEXT NOT NULL,"
+                    " value TEXT,"
+                    " checked_at REAL NOT NULL)"
+                )
+            self.connection = connection
+        return self.connection
+
+    def get(self, domain):
+        # Returns (status, value) for a fresh entry, None when missing or stale
+        with self.lock:
+            row = self.connect().execute(
+                "SELECT status, value, checked_at FROM whois_cache WHERE domain = ?", (domain,)
+            ).fetchone()
+        if row is None:
+            return None
+        status, value, checked_at = row
+        if time.time() - checked_at > self.ttls[status]:
+            return None
+        return status, value
+
+    def put(self, domain, status, value=None):
+        with self.lock, self.connect():
+            self.connection.execute(
+                "INSERT OR REPLACE INTO whois_cache (domain, status, value, checked_at) VALUES (?, ?, ?, ?)",
+                (domain, status, value, time.time()),
+            )
+
+    def close(self):
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+
+def encode_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def decode_date(value):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return value
+
+
+whois_cache = WhoisCache()
+
+
+def query_registry(domain):
+    # The blocking part of a lookup, run on a worker thread
+    import whois
+    domain_info = whois.whois(domain)
+    text = (getattr(domain_info, "text", None) or "").lower()
+    if domain_info.creation_date is None and any(reply in text for reply in THROTTLE_REPLIES):
+        # Not an answer about the domain; raising makes the scheduler back off
+        raise WhoisLookupError("The registry refused the query, too many lookups")
+    return domain_info
+
+
+async def lookup_creation_date(domain, cache=None, deadline=None, executor=None):
+    # Creation date of the domain (None if it is unregistered or the registry has
+    # none), served from the cache where possible. Unregistered domains are remembered
+    # for NEGATIVE_TTL; failed lookups raise WhoisLookupError and are remembered for
+    # ERROR_TTL, so neither hammers the registry.
+    # `deadline` (time.monotonic()) bounds the wait for the registry's rate limit and
+    # the WHOIS query itself runs on `executor` (the loop's default pool if None).
+    cache = cache or whois_cache
+    domain = domain.lower().rstrip(".")
+    cached = cache.get(domain)
+    if cached is not None:
+        status, value = cached
+        if status == ERROR:
+            raise WhoisLookupError(value)
+        return decode_date(value) if status == FOUND else None
+
+    # python-whois is slow to import and only needed on a cache miss
+    import whois
+    try:
+        # Rate limited per registry; see whois_scheduler. An unregistered domain is an
+        # answer like any other, not a reason for the registry's limiter to back off.
+        domain_info = await scheduler.run(
+            domain, query_registry, domain, executor=executor, deadline=deadline,
+            answers=(whois.parser.WhoisDomainNotFoundError,),
+        )
+    except WhoisThrottled as e:
+        # Our own back-pressure, nothing the registry said, so not worth caching
+        raise WhoisLookupError(str(e)) from e
+    except whois.parser.WhoisDomainNotFoundError:
+        # The registry answered: the domain is not registered
+        cache.put(domain, NOT_FOUND)
+        return None
+    except Exception as e:
+        cache.put(domain, ERROR, str(e))
+        raise WhoisLookupError(str(e)) from e
+
+    creation_date = domain_info.creation_date
+    if isinstance(creation_date, list):
+        creation_date = creation_date[0]
+    if creation_date is None:
+        cache.put(domain, NOT_FOUND)
+    else:
+        cache.put(domain, FOUND, encode_date(creation_date))
+    return creation_date
@@ -0,0 +1,143 @@
+import asyncio
+import time
+
+# Requests per second and burst size allowed against each registry's WHOIS server,
+# keyed by TLD. Anything not listed gets DEFAULT_LIMIT.
+REGISTRY_LIMITS = {
+    "com": (2.0, 4),
+    "net": (2.0, 4),
+    "org": (1.0, 2),
+}
+DEFAULT_LIMIT = (1.0, 2)
+# Concurrency per registry starts at 1 and grows additively while lookups succeed
+MAX_CONCURRENCY = 8
+# A lookup slower than this counts as a sign of overload, like an error
+SLOW_LATENCY = 5.0
+# How long a caller may wait for its registry before giving up, unless it passes
+# an earlier deadline of its own
+MAX_WAIT = 30.0
+
+
+class WhoisThrottled(Exception):
+    pass
+
+
+class RegistryLimiter:
+    # Token bucket for the request rate plus an AIMD window for concurrent lookups:
+    # each success widens the window by about one slot per window's worth of calls,
+    # each error or slow answer halves both the window and the rate.
+    # Callers wait on the event loop, so a busy registry holds no worker threads.
+    def __init__(self, rate, burst, max_concurrency=MAX_CONCURRENCY, slow_latency=SLOW_LATENCY):
+        self.max_rate = rate
+        self.min_rate = rate / 16
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.max_concurrency = max_concurrency
+        self.slow_latency = slow_latency
+        self.window = 1.0
+        self.active = 0
+        # Futures of the callers waiting for a slot, woken when one is released
+        self.waiters = set()
+        self.requests = 0
+        self.failures = 0
+        self.throttled = 0
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, deadline):
+        while True:
+            now = time.monotonic()
+            self.refill(now)
+            if self.active < int(self.window) and self.tokens >= 1:
+                self.tokens -= 1
+                self.active += 1
+                self.requests += 1
+                return
+            if now >= deadline:
+                self.throttled += 1
+                raise WhoisThrottled("Too many WHOIS lookups for this registry, try again later")
+            # Sleep until the next token is due; a finishing lookup wakes us earlier
+            wait = (1 - self.tokens) / self.rate if self.tokens < 1 else deadline - now
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.add(waiter)
+            try:
+                await asyncio.wait_for(waiter, min(wait, deadline - now))
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self.waiters.discard(waiter)
+
+    def release(self, latency, failed):
+        self.active -= 1
+        if failed or latency > self.slow_latency:
+            self.failures += 1
+            self.window = max(1.0, self.window / 2)
+            self.rate = max(self.min_rate, self.rate / 2)
+        else:
+            self.window = min(self.max_concurrency, self.window + 1 / self.window)
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 16)
+        for waiter in self.waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def stats(self):
+        return {
+            "rate": round(self.rate, 3),
+            "window": round(self.window, 2),
+            "active": self.active,
+            "requests": self.requests,
+            "failures": self.failures,
+            "throttled": self.throttled,
+        }
+
+
+class WhoisScheduler:
+    # Used from the event loop only; the lookups themselves run on an executor
+    def __init__(self, limits=REGISTRY_LIMITS, default=DEFAULT_LIMIT, max_wait=MAX_WAIT):
+        self.limits = limits
+        self.default = default
+        self.max_wait = max_wait
+        self.limiters = {}
+
+    @staticmethod
+    def registry(domain):
+        # Every domain under a TLD is answered by that TLD's registry
+        return domain.lower().rstrip(".").rsplit(".", 1)[-1]
+
+    def limiter(self, domain):
+        registry = self.registry(domain)
+        if registry not in self.limiters:
+            self.limiters[registry] = RegistryLimiter(*self.limits.get(registry, self.default))
+        return self.limiters[registry]
+
+    async def run(self, domain, fn, *args, executor=None, deadline=None, answers=()):
+        # Waits for a slot at the domain's registry, then runs the blocking `fn(*args)`
+        # on `executor`. `deadline` is a time.monotonic() value; a caller that will stop
+        # waiting for the result by then should not hold its place in the queue any
+        # longer. Exceptions of the `answers` types are replies from the registry (such
+        # as "no such domain") and count as successes; any other exception or a slow
+        # answer makes the limiter back off.
+        limiter = self.limiter(domain)
+        wait_until = time.monotonic() + self.max_wait
+        await limiter.acquire(wait_until if deadline is None else min(deadline, wait_until))
+        start = time.monotonic()
+        future = asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+
+        def done(future):
+            error = None if future.cancelled() else future.exception()
+            limiter.release(time.monotonic() - start, error is not None and not isinstance(error, answers))
+
+        future.add_done_callback(done)
+        # The slot stays taken until the query is over, even when the caller gives up
+        # on it first: the registry is still answering it
+        return await asyncio.shield(future)
+
+    def stats(self):
+        return {registry: limiter.stats() for registry, limiter in self.limiters.items()}
+
+
+scheduler = WhoisScheduler()
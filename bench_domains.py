@@ -0,0 +1,51 @@
+import argparse
+import timeit
+import publicsuffix2 as psl
+import validators
+from bench_parser import sample_responses
+from final import DNS_Parser, registered_domain
+
+
+def old_valid_domain(domain: str):
+    # What valid_domain did before: regex validation, then a public suffix lookup
+    return validators.domain(domain) and psl.get_sld(domain, strict=True)
+
+
+def uncached(domain: str):
+    return registered_domain.__wrapped__(domain)
+
+
+def parse(response: bytes, validate: bool):
+    parser = DNS_Parser(response, validate=validate)
+    parser.parse_dns_response()
+    return parser.raw
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Cost of domain validation + registered domain lookup')
+    arg_parser.add_argument('-n', '--number', type=int, default=20000)
+    arg_parser.add_argument('--records', type=int, default=8, help='answers per MX response')
+    args = arg_parser.parse_args()
+
+    names = ['example.com', 'mail.google.com', 'www.bbc.co.uk', 'a.b.city.kawasaki.jp']
+    for name in names:
+        assert bool(old_valid_domain(name)) and registered_domain(name) == psl.get_sld(name, strict=True)
+
+    print(f'{"per name":<30}{"us":>10}')
+    for label, check in (
+        ('validators + publicsuffix2', old_valid_domain),
+        ('suffix trie', uncached),
+        ('suffix trie + LRU', registered_domain),
+    ):
+        t = timeit.timeit(lambda: [check(name) for name in names], number=args.number)
+        print(f'{label:<30}{t / args.number / len(names) * 1e6:>10.2f}')
+
+    response = sample_responses(args.records)['MX']
+    print(f'\n{"MX response":<30}{"us":>10}')
+    for label, validate in (('validated', True), ('trusted (validate=False)', False)):
+        t = timeit.timeit(lambda: parse(response, validate), number=args.number)
+        print(f'{label:<30}{t / args.number * 1e6:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
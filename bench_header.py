@@ -0,0 +1,59 @@
+import argparse
+import timeit
+from bench_parser import sample_responses
+from final import DECODE_HEADER, DECODE_FLAG, FLAG_LENGTH, FLAGS, HEADERS, HEADER, HeaderFlags
+
+
+def string_flags(flag: str) -> dict:
+    # The previous decoder: hex string -> 16-char binary string -> int() per field
+    flag = '{:016b}'.format(int(flag, 16))
+    index = 0
+    flags = []
+    for i, f in zip(FLAG_LENGTH, DECODE_FLAG):
+        flags.append(f(int(flag[index:index+i], 2)))
+        index += i
+    return dict(zip(FLAGS, flags))
+
+
+def before(response: bytes) -> dict:
+    headers = [f(response[:12][i:i+2]) for f, i in zip(DECODE_HEADER, range(0, 12, 2))]
+    question = dict(zip(HEADERS, headers))
+    flags = question['Flags']
+    question['Flags'] = {
+        'Hexadecimal': flags, 'Binary': f'{int(flags, 16):016b}',
+        'Breakdown': string_flags(flags)
+    }
+    return question
+
+
+def after(response: bytes) -> dict:
+    ident, flags, *counts = HEADER.unpack_from(response)
+    return dict(zip(HEADERS, [ident.hex(), HeaderFlags(flags), *counts]))
+
+
+def after_presented(response: bytes) -> dict:
+    # Same, but a caller that asks for the presentation strings as well
+    question = after(response)
+    question['Flags']['Hexadecimal'], question['Flags']['Binary']
+    return question
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Per-packet cost of decoding the DNS header')
+    arg_parser.add_argument('-n', '--number', type=int, default=200000)
+    args = arg_parser.parse_args()
+
+    response = sample_responses()['A']
+    assert before(response)['Flags']['Breakdown'] == after(response)['Flags']['Breakdown']
+    print(f'{"decoder":<28}{"us/packet":>10}')
+    for label, decode in (
+        ('strings (before)', before),
+        ('shifts + table', after),
+        ('shifts + table, Binary/Hex', after_presented),
+    ):
+        t = timeit.timeit(lambda: decode(response), number=args.number) / args.number * 1e6
+        print(f'{label:<28}{t:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
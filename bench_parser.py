@@ -0,0 +1,77 @@
+import argparse
+import ipaddress
+import struct
+import timeit
+from final import QTYPE, DNS_Parser, DNS_FastParser, EDNS_UDP_SIZE, opt_record
+
+
+def encode_name(name: str) -> bytes:
+    return b''.join(bytes([len(label)]) + label.encode('utf8') for label in name.split('.')) + b'\0'
+
+
+def build_response(qname: str, qtype: str, rdatas: list, ttl: int = 3600) -> bytes:
+    # Every answer owner name is a pointer back to the question name at offset 12.
+    # An option-less OPT record follows, as in the answer to any EDNS query.
+    header = struct.pack('!HHHHHH', 0x1234, 0x8180, 1, len(rdatas), 0, 1)
+    question = encode_name(qname) + struct.pack('!HH', QTYPE[qtype], 1)
+    answers = b''.join(
+        b'\xc0\x0c' + struct.pack('!HHIH', QTYPE[qtype], 1, ttl, len(rdata)) + rdata
+        for rdata in rdatas
+    )
+    return header + question + answers + opt_record(EDNS_UDP_SIZE)
+
+
+def sample_responses(count: int = 4) -> dict:
+    return {
+        'A': build_response('www.example.com', 'A', [
+            bytes([93, 184, 216, i]) for i in range(count)
+        ]),
+        'AAAA': build_response('www.example.com', 'AAAA', [
+            ipaddress.IPv6Address(f'2606:2800:220:1::{i + 1:x}').packed for i in range(count)
+        ]),
+        'MX': build_response('example.com', 'MX', [
+            struct.pack('!H', 10 * (i + 1)) + bytes([len(f'mail{i}')]) + f'mail{i}'.encode() + b'\xc0\x0c'
+            for i in range(count)
+        ]),
+        'TXT': build_response('example.com', 'TXT', [
+            bytes([len(text)]) + text for text in (
+                b'v=spf1 include:_spf.example.com ~all',
+                b'google-site-verification=abcdefghijklmnopqrstuvwxyz0123456789',
+            )
+        ]),
+    }
+
+
+def legacy(response: bytes):
+    parser = DNS_Parser(response)
+    parser.parse_dns_response()
+    return parser.raw
+
+
+def fast(response: bytes):
+    parser = DNS_FastParser(response)
+    parser.parse_dns_response()
+    return parser
+
+
+def fast_dict(response: bytes):
+    return fast(response).raw
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Compare DNS_Parser and DNS_FastParser')
+    arg_parser.add_argument('-n', '--number', type=int, default=20000)
+    arg_parser.add_argument('--records', type=int, default=4, help='answers per A/AAAA/MX response')
+    args = arg_parser.parse_args()
+
+    print(f'{"type":<6}{"DNS_Parser":>14}{"fast":>14}{"fast + raw":>14}   (us/packet)')
+    for qtype, response in sample_responses(args.records).items():
+        timings = [
+            timeit.timeit(lambda: parse(response), number=args.number) / args.number * 1e6
+            for parse in (legacy, fast, fast_dict)
+        ]
+        print(f'{qtype:<6}' + ''.join(f'{t:>14.2f}' for t in timings))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import socket
+import time
+from final import make_query
+from resolver import DNS_Resolver
+from DNS.dnsnet.stub import start_stub_servers
+
+
+def blocking_lookups(names, port):
+    # Same pattern as final.dns_query: one socket and one blocking round trip per lookup
+    for name in names:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(2)
+        try:
+            sock.sendto(make_query(name, 'A'), ('127.0.0.1', port))
+            sock.recv(8192)
+        except socket.timeout:
+            pass
+        finally:
+            sock.close()
+
+
+async def main():
+    arg_parser = argparse.ArgumentParser(description='Benchmark the asyncio resolver against a local stub server')
+    arg_parser.add_argument('-n', '--queries', type=int, default=20000)
+    arg_parser.add_argument('--delay', type=float, default=0.005, help='stub server reply delay in seconds')
+    arg_parser.add_argument('--loss', type=float, default=0.0, help='fraction of queries the stub drops')
+    arg_parser.add_argument('--sockets', type=int, default=4)
+    arg_parser.add_argument('--concurrency', type=int, default=500)
+    arg_parser.add_argument('--timeout', type=float, default=1.0)
+    args = arg_parser.parse_args()
+
+    _, port = start_stub_servers([{'delay': args.delay, 'loss': args.loss}])[0]
+    names = [f'host{i}.example.com' for i in range(args.queries)]
+
+    # The blocking baseline is slow, so only run a slice of it
+    sample = names[:min(len(names), 200)]
+    start = time.perf_counter()
+    await asyncio.to_thread(blocking_lookups, sample, port)
+    elapsed = time.perf_counter() - start
+    print(f'blocking:  {len(sample)} queries in {elapsed:.2f}s ({len(sample)/elapsed:.0f} q/s)')
+
+    resolver = DNS_Resolver('127.0.0.1', port, sockets=args.sockets, timeout=args.timeout,
+                            concurrency=args.concurrency)
+    async with resolver:
+        start = time.perf_counter()
+        answered = errors = 0
+        async for result in resolver.resolve_many((name, 'A') for name in names):
+            if 'Error' in result:
+                errors += 1
+            else:
+                answered += 1
+        elapsed = time.perf_counter() - start
+    print(f'asyncio:   {len(names)} queries in {elapsed:.2f}s ({len(names)/elapsed:.0f} q/s), '
+          f'{answered} answered, {errors} failed')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DNS_DIR = os.path.join(ROOT, 'DNS')
+
+# Module -> directory it is imported from (the DNS apps import their siblings by name)
+MODULES = {
+    'final': ROOT,
+    'resolver': ROOT,
+    'query_cli': ROOT,
+    'dnsnet.dns_wire': DNS_DIR,
+    'all_wo_dns': DNS_DIR,
+    'all_wi_dns': DNS_DIR,
+}
+
+
+def import_times(module: str, cwd: str) -> dict:
+    # Runs `python -X importtime -c "import <module>"` in a fresh interpreter and
+    # returns {imported module: cumulative microseconds}
+    env = dict(os.environ)
+    # Measure imports, not compiling: let .pyc files be written and reused
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True
+    )
+    # A module is listed after everything it imports, so the direct imports of
+    # `module` are the one-level-indented lines since the previous top-level import
+    children = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.rstrip()[1:]
+        if not name.startswith(' '):
+            if name == module:
+                return {**children, module: int(cumulative)}
+            children = {}
+        elif not name.startswith('   '):
+            children[name.strip()] = int(cumulative)
+    raise RuntimeError(f'{module} not found in the -X importtime output')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Import cost of the DNS modules (python -X importtime)')
+    arg_parser.add_argument('modules', nargs='*', default=list(MODULES), help='modules to measure')
+    arg_parser.add_argument('-r', '--repeat', type=int, default=5, help='fresh interpreters per module')
+    arg_parser.add_argument('--top', type=int, default=3, help='heaviest direct imports to list')
+    arg_parser.add_argument('--max-ms', type=float, help='exit non-zero if any module takes longer')
+    args = arg_parser.parse_args()
+
+    over_budget = []
+    for module in args.modules:
+        cwd = MODULES.get(module, ROOT)
+        import_times(module, cwd)  # warm-up, writes the .pyc files
+        runs = [import_times(module, cwd) for _ in range(args.repeat)]
+        total = statistics.median(run[module] for run in runs) / 1000
+        heaviest = sorted(
+            ((statistics.median(run.get(name, 0) for run in runs) / 1000, name)
+             for name in runs[0] if name != module),
+            reverse=True
+        )[:args.top]
+        print(f'{module:<16}{total:>9.1f} ms   ' + ', '.join(f'{name} {ms:.1f}' for ms, name in heaviest))
+        if args.max_ms is not None and total > args.max_ms:
+            over_budget.append(module)
+
+    if over_budget:
+        sys.exit(f'over {args.max_ms} ms: {", ".join(over_budget)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import functools
+import json
+import os
+import sys
+from final import RCODE
+from resolver import DNS_Resolver
+from DNS.dnsnet.dns_wire import NOERROR, NXDOMAIN
+# The same input format and resume bookkeeping as POST /bulk-scan of DNS/all_wi_dns.py
+from DNS.dnsnet.scan import read_domains, scan
+
+
+def texts(raw: dict, prefix: str) -> list:
+    return [
+        answer['RData']['Text'] for answer in raw.get('Answers', [])
+        if answer['QType'] == 'TXT' and answer['RData']['Text'].startswith(prefix)
+    ]
+
+
+def exchanges(raw: dict) -> list:
+    return [
+        {'priority': answer['RData']['Preference'], 'mail_server': answer['RData']['Mail Exchange']}
+        for answer in raw.get('Answers', []) if answer['QType'] == 'MX'
+    ]
+
+
+async def lookup(resolver: DNS_Resolver, query: str, qtype: str, extract, *args):
+    try:
+        raw = await resolver.resolve(query, qtype, exact=True)
+    except Exception as e:
+        return {'error': f'An error occurred: {str(e)}'}
+    # A SERVFAIL/REFUSED answer has no records either, but it says nothing about the
+    # domain; reported as "none found" it would pass for a missing SPF/DMARC/MX record
+    rcode = raw['Question']['Flags'].word & 0xF
+    if rcode not in (NOERROR, NXDOMAIN):
+        return {'error': f'An error occurred: the server answered {RCODE.get(rcode, rcode)}'}
+    return extract(raw, *args)
+
+
+async def scan_domain(resolver: DNS_Resolver, index: int, domain: str) -> dict:
+    spf, dmarc, mx = await asyncio.gather(
+        lookup(resolver, domain, 'TXT', texts, 'v=spf1'),
+        lookup(resolver, f'_dmarc.{domain}', 'TXT', texts, 'v=DMARC1'),
+        lookup(resolver, domain, 'MX', exchanges),
+    )
+    return {'index': index, 'domain': domain, 'spf_records': spf, 'dmarc_records': dmarc, 'mx_records': mx}
+
+
+def last_resume_offset(path: str) -> int:
+    offset = 0
+    with open(path) as output:
+        for line in output:
+            try:
+                offset = max(offset, json.loads(line)['resume_offset'])
+            except (ValueError, KeyError):
+                # A crash can leave a partially written last line behind
+                continue
+    return offset
+
+
+async def main():
+    arg_parser = argparse.ArgumentParser(description='Scan SPF, DMARC and MX records for a list of domains')
+    arg_parser.add_argument('input', help="file with one domain per line, or '-' for stdin")
+    arg_parser.add_argument('-o', '--output', help='NDJSON output file (default: stdout)')
+    arg_parser.add_argument('--offset', type=int, default=0, help='skip this many domains of the input')
+    arg_parser.add_argument('--resume', action='store_true',
+                            help='continue from the resume_offset recorded in --output and append to it')
+    arg_parser.add_argument('--server', default='8.8.8.8')
+    arg_parser.add_argument('--port', type=int, default=53)
+    arg_parser.add_argument('-c', '--concurrency', type=int, default=200, help='domains scanned at once')
+    arg_parser.add_argument('--timeout', type=float, default=2.0)
+    arg_parser.add_argument('--validate', action='store_true',
+                            help='validate names in answers (off: the upstream is trusted)')
+    args = arg_parser.parse_args()
+
+    offset = args.offset
+    mode = 'w'
+    if args.resume:
+        if not args.output:
+            arg_parser.error('--resume needs --output')
+        if os.path.exists(args.output):
+            offset = last_resume_offset(args.output)
+            mode = 'a'
+
+    source = sys.stdin if args.input == '-' else open(args.input)
+    output = open(args.output, mode) if args.output else sys.stdout
+    resolver = DNS_Resolver(args.server, args.port, timeout=args.timeout,
+                            concurrency=args.concurrency * 3, fast=True, validate=args.validate)
+    try:
+        async with resolver:
+            jobs = functools.partial(scan_domain, resolver)
+            async for result in scan(read_domains(source), jobs, args.concurrency, offset):
+                output.write(json.dumps(result) + '\n')
+    finally:
+        output.flush()
+        if output is not sys.stdout:
+            output.close()
+        if source is not sys.stdin:
+            source.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,290 @@
+import argparse
+import random
+import struct
+import time
+import tracemalloc
+from final import QTYPE, DNS_Parser, DNS_FastParser, EDNS_UDP_SIZE, opt_record
+# The parser behind the FastAPI apps
+from DNS.dnsnet.dns_wire import parse_message
+
+# A corpus is a plain concatenation of DNS messages, each prefixed with its length
+# as a 2-byte big-endian integer (the same framing as DNS over TCP), so corpora can
+# be joined with `cat`. final.CAPTURE / query_cli.py --capture and the
+# DNS_CAPTURE_FILE environment variable of DNS/all_wo_dns.py record live responses
+# in this format.
+FRAME = struct.Struct('!H')
+
+SYNTH_TYPES = ['A', 'AAAA', 'MX', 'TXT', 'NS', 'CNAME', 'PTR']
+
+
+def read_corpus(path: str):
+    with open(path, 'rb') as corpus:
+        while True:
+            header = corpus.read(FRAME.size)
+            if len(header) < FRAME.size:
+                break
+            packet = corpus.read(FRAME.unpack(header)[0])
+            if len(packet) < FRAME.unpack(header)[0]:
+                # Capture interrupted in the middle of a write
+                break
+            yield packet
+
+
+def write_corpus(path: str, packets, append: bool = False) -> int:
+    count = 0
+    with open(path, 'ab' if append else 'wb') as corpus:
+        for packet in packets:
+            corpus.write(FRAME.pack(len(packet)) + packet)
+            count += 1
+    return count
+
+
+class MessageBuilder:
+    # Writes a response the way a server would, compressing every name against all
+    # name suffixes already in the message (pointers can go past offset 255)
+    def __init__(self, qname: str, qtype: str, rcode: int = 0) -> None:
+        self.buffer = bytearray(12)
+        self.suffixes = {}
+        self.qtype = QTYPE[qtype]
+        self.flags = 0x8180 | rcode
+        self.answers = 0
+        self.additional = 0
+        self.name(qname)
+        self.buffer += struct.pack('!HH', self.qtype, 1)
+
+    def name(self, name: str):
+        labels = name.split('.')
+        for i in range(len(labels)):
+            suffix = '.'.join(labels[i:]).lower()
+            if suffix in self.suffixes:
+                self.buffer += struct.pack('!H', 0xc000 | self.suffixes[suffix])
+                return
+            if len(self.buffer) < 0x4000:
+                self.suffixes[suffix] = len(self.buffer)
+            self.buffer += bytes([len(labels[i])]) + labels[i].encode('utf8')
+        self.buffer += b'\0'
+
+    def record(self, owner: str, rtype: str, ttl: int, write_rdata):
+        self.name(owner)
+        self.buffer += struct.pack('!HHI', QTYPE[rtype], 1, ttl)
+        length_at = len(self.buffer)
+        self.buffer += b'\0\0'
+        write_rdata()
+        struct.pack_into('!H', self.buffer, length_at, len(self.buffer) - length_at - 2)
+        self.answers += 1
+
+    def address(self, owner: str, rtype: str, packed: bytes, ttl: int = 300):
+        self.record(owner, rtype, ttl, lambda: self.buffer.extend(packed))
+
+    def domain(self, owner: str, rtype: str, target: str, ttl: int = 3600):
+        self.record(owner, rtype, ttl, lambda: self.name(target))
+
+    def mx(self, owner: str, preference: int, exchange: str, ttl: int = 3600):
+        def write():
+            self.buffer += struct.pack('!H', preference)
+            self.name(exchange)
+        self.record(owner, 'MX', ttl, write)
+
+    def txt(self, owner: str, text: bytes, ttl: int = 3600):
+        def write():
+            # Split into <=255-byte character-strings like long SPF/DKIM records are
+            for i in range(0, len(text), 255):
+                chunk = text[i:i+255]
+                self.buffer += bytes([len(chunk)]) + chunk
+        self.record(owner, 'TXT', ttl, write)
+
+    def opt(self, udp_size: int = EDNS_UDP_SIZE):
+        # The EDNS(0) OPT record a server echoes to an EDNS query, with no options
+        # (RDLENGTH 0); it is the only additional record, so it goes last
+        self.buffer += opt_record(udp_size)
+        self.additional += 1
+
+    def message(self, query_id: int) -> bytes:
+        struct.pack_into('!HHHHHH', self.buffer, 0, query_id, self.flags, 1, self.answers, 0, self.additional)
+        return bytes(self.buffer)
+
+
+def synthetic_message(rng: random.Random, qtype: str) -> bytes:
+    domain = f'example{rng.randrange(500)}.{rng.choice(["com", "net", "org", "co.uk", "de"])}'
+    if qtype in ('A', 'AAAA'):
+        qname = f'{rng.choice(["www", "api", "mail", "cdn"])}.{domain}'
+        builder = MessageBuilder(qname, qtype)
+        owner = qname
+        if rng.random() < 0.3:
+            # Answer through a CNAME, as for most CDN-hosted names
+            owner = f'{domain.split(".")[0]}.edge{rng.randrange(9)}.cdnprovider.net'
+            builder.domain(qname, 'CNAME', owner, ttl=300)
+        for _ in range(rng.randint(1, 6)):
+            size = 4 if qtype == 'A' else 16
+            builder.address(owner, qtype, bytes(rng.getrandbits(8) for _ in range(size)))
+    elif qtype == 'MX':
+        builder = MessageBuilder(domain, qtype)
+        if rng.random() < 0.5:
+            for i in range(rng.randint(1, 5)):
+                builder.mx(domain, 10 * (i + 1), f'mx{i}.{domain}')
+        else:
+            builder.mx(domain, 1, 'aspmx.l.google.com')
+            for i in range(1, rng.randint(2, 5)):
+                builder.mx(domain, 5 * i, f'alt{i}.aspmx.l.google.com')
+    elif qtype == 'TXT':
+        builder = MessageBuilder(domain, qtype)
+        includes = ' '.join(f'include:_spf{i}.{domain}' for i in range(rng.randint(1, 20)))
+        builder.txt(domain, f'v=spf1 {includes} ~all'.encode())
+        for _ in range(rng.randint(0, 3)):
+            token = ''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789') for _ in range(43))
+            builder.txt(domain, f'google-site-verification={token}'.encode())
+    elif qtype == 'NS':
+        builder = MessageBuilder(domain, qtype)
+        provider = rng.choice(['awsdns-01.org', 'ns.cloudflare.com', 'domaincontrol.com', domain])
+        for i in range(rng.randint(2, 4)):
+            builder.domain(domain, 'NS', f'ns{i + 1}.{provider}', ttl=172800)
+    elif qtype == 'CNAME':
+        qname = f'www.{domain}'
+        builder = MessageBuilder(qname, qtype)
+        builder.domain(qname, 'CNAME', f'{domain.split(".")[0]}.edge{rng.randrange(9)}.cdnprovider.net')
+    else:
+        octets = [rng.randrange(1, 255) for _ in range(4)]
+        qname = '.'.join(str(o) for o in reversed(octets)) + '.in-addr.arpa'
+        builder = MessageBuilder(qname, 'PTR', rcode=0 if rng.random() < 0.8 else 3)
+        if builder.flags & 0xf == 0:
+            builder.domain(qname, 'PTR', f'host-{"-".join(map(str, octets))}.dyn.isp{octets[0] % 7}.example.net')
+    # Our resolvers send EDNS queries, so most answers carry an OPT record
+    if rng.random() < 0.8:
+        builder.opt()
+    return builder.message(rng.getrandbits(16))
+
+
+def synthetic_corpus(count: int, seed: int = 0, types: list = SYNTH_TYPES):
+    rng = random.Random(seed)
+    for i in range(count):
+        yield synthetic_message(rng, types[i % len(types)])
+
+
+def question_type(packet: bytes) -> str:
+    try:
+        pos = 12
+        while packet[pos]:
+            pos += packet[pos] + 1
+        return QTYPE.get(int.from_bytes(packet[pos+1:pos+3], 'big'), 'other')
+    except IndexError:
+        return 'malformed'
+
+
+def parse_legacy(packet: bytes):
+    parser = DNS_Parser(packet)
+    parser.parse_dns_response()
+    return parser.raw
+
+
+def parse_fast(packet: bytes):
+    parser = DNS_FastParser(packet)
+    parser.parse_dns_response()
+    return parser
+
+
+def parse_fast_raw(packet: bytes):
+    return parse_fast(packet).raw
+
+
+PARSERS = {
+    'legacy': parse_legacy,
+    'fast': parse_fast,
+    'fast_raw': parse_fast_raw,
+    'wire': parse_message,
+}
+
+
+def run(parse, packets: list) -> tuple:
+    errors = 0
+    start = time.perf_counter()
+    for packet in packets:
+        try:
+            parse(packet)
+        except Exception:
+            errors += 1
+    return time.perf_counter() - start, errors
+
+
+def allocations(parse, packets: list) -> tuple:
+    # Blocks and bytes still held per packet while the results are kept alive, and
+    # the average peak of memory allocated while parsing one packet
+    results = []
+    peaks = 0
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        for packet in packets:
+            tracemalloc.reset_peak()
+            start = tracemalloc.get_traced_memory()[0]
+            try:
+                results.append(parse(packet))
+            except Exception:
+                pass
+            peaks += tracemalloc.get_traced_memory()[1] - start
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    diff = after.compare_to(before, 'filename')
+    blocks = sum(stat.count_diff for stat in diff)
+    size = sum(stat.size_diff for stat in diff)
+    return blocks / len(packets), size / len(packets), peaks / len(packets)
+
+
+def replay(packets: list, parsers: list, repeat: int, alloc_sample: int):
+    by_type = {}
+    for packet in packets:
+        by_type.setdefault(question_type(packet), []).append(packet)
+    print(f'{len(packets)} packets: ' + ', '.join(f'{t} {len(p)}' for t, p in sorted(by_type.items())))
+
+    print(f'\n{"parser":<10}{"packets/s":>12}{"us/packet":>11}{"errors":>8}'
+          f'{"blocks/pkt":>12}{"bytes/pkt":>11}{"peak B/pkt":>12}')
+    for name in parsers:
+        parse = PARSERS[name]
+        elapsed, errors = min(run(parse, packets) for _ in range(repeat))
+        blocks, size, peak = allocations(parse, packets[:alloc_sample])
+        print(f'{name:<10}{len(packets) / elapsed:>12.0f}{elapsed / len(packets) * 1e6:>11.2f}{errors:>8}'
+              f'{blocks:>12.1f}{size:>11.0f}{peak:>12.0f}')
+
+    print(f'\n{"packets/s":<10}' + ''.join(f'{name:>14}' for name in parsers) + '   (errors)')
+    for qtype, group in sorted(by_type.items()):
+        cells = []
+        for name in parsers:
+            elapsed, errors = min(run(PARSERS[name], group) for _ in range(repeat))
+            cell = f'{len(group) / elapsed:.0f}' + (f' ({errors})' if errors else '')
+            cells.append(f'{cell:>14}')
+        print(f'{qtype:<10}' + ''.join(cells))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Record, generate and replay corpora of raw DNS responses')
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+
+    synth_parser = commands.add_parser('synth', help='write a synthetic corpus')
+    synth_parser.add_argument('-o', '--output', required=True)
+    synth_parser.add_argument('-n', '--count', type=int, default=10000)
+    synth_parser.add_argument('--seed', type=int, default=0)
+    synth_parser.add_argument('--types', default=','.join(SYNTH_TYPES))
+
+    replay_parser = commands.add_parser('replay', help='parse a corpus at full speed and report the cost')
+    replay_parser.add_argument('corpus', nargs='*', help='corpus files (default: a synthetic corpus)')
+    replay_parser.add_argument('-n', '--count', type=int, default=10000, help='size of the synthetic corpus')
+    replay_parser.add_argument('--parsers', default=','.join(PARSERS), help=f'any of {", ".join(PARSERS)}')
+    replay_parser.add_argument('-r', '--repeat', type=int, default=3, help='runs per measurement, best is kept')
+    replay_parser.add_argument('--alloc-sample', type=int, default=2000, help='packets traced with tracemalloc')
+
+    args = arg_parser.parse_args()
+    if args.command == 'synth':
+        count = write_corpus(args.output, synthetic_corpus(args.count, args.seed, args.types.split(',')))
+        print(f'{count} messages written to {args.output}')
+    else:
+        if args.corpus:
+            packets = [packet for path in args.corpus for packet in read_corpus(path)]
+        else:
+            packets = list(synthetic_corpus(args.count))
+        if not packets:
+            arg_parser.error('the corpus is empty')
+        replay(packets, args.parsers.split(','), args.repeat, args.alloc_sample)
+
+
+if __name__ == '__main__':
+    main()
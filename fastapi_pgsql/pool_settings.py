@@ -0,0 +1,41 @@
+import os
+
+# Connection pool settings of the async engine, read from the same DB_POOL_*
+# variables as student_db/pool_settings.py. Every request holds one connection while
+# it runs, so POOL_SIZE + MAX_OVERFLOW caps concurrent requests.
+
+
+def env_flag(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    value = value.strip().lower()
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("0", "false", "no", "off", ""):
+        return False
+    raise ValueError(f"{name} should be a boolean (1/0, true/false, yes/no, on/off), not {value!r}")
+
+
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", 20))
+MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", 30))
+POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+POOL_PRE_PING = env_flag("DB_POOL_PRE_PING", True)
+# Prepared statements cached per asyncpg connection; 0 behind PgBouncer in transaction mode
+STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100))
+
+
+def async_url(url):
+    # The same database through its asyncio driver
+    return url.replace("postgresql://", "postgresql+asyncpg://", 1).replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+
+def engine_options(url):
+    options = dict(
+        pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE, pool_pre_ping=POOL_PRE_PING,
+    )
+    if url.startswith("postgresql+asyncpg://"):
+        options["connect_args"] = {"prepared_statement_cache_size": STATEMENT_CACHE_SIZE}
+    return options
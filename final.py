@@ -1,9 +1,16 @@
+import functools
 import ipaddress
-import publicsuffix2 as psl
 import random
+import re
 import socket
-import validators
+import struct
 from collections import defaultdict
+# EDNS(0) and the TC bit are handled the same way as in the FastAPI apps
+from DNS.dnsnet.dns_wire import EDNS_UDP_SIZE, opt_record, is_truncated, read_name as decode_name
+
+# Importing this module has no side effects. publicsuffix2 (which loads the whole
+# list on import) and validators are only imported when first needed, and the
+# interactive lookup lives in query_cli.py.
 
 QTYPE = {
     1: 'A',    
@@ -13,15 +20,24 @@ QTYPE = {
     15: 'MX',  
     16: 'TXT', 
     28: 'AAAA',
+    41: 'OPT',
     'A': 1,    
     'NS': 2,   
     'CNAME': 5, 
     'PTR': 12, 
     'MX': 15,  
     'TXT': 16, 
-    'AAAA': 28
+    'AAAA': 28,
+    'OPT': 41
 }
 
+# Upstream resolvers for the command line lookup, tried in order
+DNS_SERVERS = ['8.8.8.8', '1.1.1.1', '9.9.9.9']
+
+# Binary file object that dns_query appends every raw response to, each prefixed
+# with its 2-byte length; replay it offline with dns_corpus.py
+CAPTURE = None
+
 OPCODE = {
     0: 'Query',
     1: 'IQuery',
@@ -102,18 +118,54 @@ FLAGS = [
 
 DECODE_FLAG = [bool, dns_opcode, bool, bool, bool, bool, int, bool, dns_cd, dns_rcode]
 
+# Bit offset and mask of every field in the 16-bit flags word, in FLAGS order
+FLAG_FIELDS = [
+    (name, 16 - sum(FLAG_LENGTH[:i+1]), (1 << length) - 1, decode)
+    for i, (name, length, decode) in enumerate(zip(FLAGS, FLAG_LENGTH, DECODE_FLAG))
+]
+
+# Flags word -> decoded breakdown. Responses only ever use a handful of distinct
+# words, so this fills up after the first few packets (at most 65536 entries).
+FLAG_BREAKDOWNS = {}
+
+def flag_breakdown(word: int) -> dict:
+    breakdown = FLAG_BREAKDOWNS.get(word)
+    if breakdown is None:
+        breakdown = FLAG_BREAKDOWNS[word] = {
+            name: decode((word >> shift) & mask) for name, shift, mask, decode in FLAG_FIELDS
+        }
+    # Callers get their own copy; the cached one is shared by every response
+    return dict(breakdown)
+
 def decode_flags(flag: str) -> dict:
     if not isinstance(flag, str):
         raise TypeError()
     if not (len(flag) == 4 and all(i in '0123456789abcdef' for i in flag)):
         raise ValueError()
-    flag = '{:016b}'.format(int(flag, 16))
-    index = 0
-    flags = []
-    for i, f in zip(FLAG_LENGTH, DECODE_FLAG):
-        flags.append(f(int(flag[index:index+i], 2)))
-        index += i
-    return dict(zip(FLAGS, flags))
+    return flag_breakdown(int(flag, 16))
+
+class HeaderFlags(dict):
+    # Holds the 'Breakdown' of a flags word. The 'Hexadecimal' and 'Binary'
+    # presentation strings are only formatted when somebody looks them up.
+    def __init__(self, word: int):
+        super().__init__(Breakdown=flag_breakdown(word))
+        self.word = word
+
+    def __missing__(self, key):
+        if key == 'Hexadecimal':
+            value = f'{self.word:04x}'
+        elif key == 'Binary':
+            value = f'{self.word:016b}'
+        else:
+            raise KeyError(key)
+        self[key] = value
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
 
 def decode_response(fields: bytes) -> dict:
     if not isinstance(fields, bytes):
@@ -121,7 +173,11 @@ def decode_response(fields: bytes) -> dict:
     if len(fields) != 10:
         raise ValueError()
     qtype = QTYPE[byte2int(fields[:2])]
-    qclass = dns_qclass(byte2int(fields[2:4]))
+    if qtype == 'OPT':
+        # The OPT pseudo-record reuses CLASS for the sender's UDP payload size
+        qclass = byte2int(fields[2:4])
+    else:
+        qclass = dns_qclass(byte2int(fields[2:4]))
     ttl = byte2int(fields[4:8])
     length = byte2int(fields[8:10])
     return {
@@ -131,16 +187,93 @@ def decode_response(fields: bytes) -> dict:
         'Data length': length
     }
 
+def decode_opt(udp_size: int, ttl: int, options: bytes) -> dict:
+    # The OPT TTL field carries the extended RCODE, EDNS version and flags (RFC 6891)
+    return {
+        'UDP payload size': udp_size,
+        'Extended RCODE': ttl >> 24,
+        'EDNS version': (ttl >> 16) & 0xff,
+        'DNSSEC OK': bool(ttl & 0x8000),
+        'Options': options.hex()
+    }
+
+# Labels as `validators.domain` accepts them; the last one (the TLD) has to end in a letter
+LABEL = re.compile(r'[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?')
+TLD_LABEL = re.compile(r'[a-z0-9][a-z0-9-]{0,61}[a-z]')
+DOMAIN_CACHE_SIZE = 65536
+
+SUFFIX_TRIE = None
+
+def suffix_trie() -> dict:
+    # The public suffix list as nested dicts keyed by label, rightmost label first.
+    # Like publicsuffix2, every node on a rule's path counts as a suffix; exception
+    # rules (!www.ck) are marked with a '!' key. Built on first use.
+    global SUFFIX_TRIE
+    if SUFFIX_TRIE is None:
+        import publicsuffix2
+        trie = {}
+        for rule in publicsuffix2.PublicSuffixList().tlds:
+            rule = rule.split()[0].lstrip('.')
+            node = trie
+            for label in reversed(rule.lstrip('!').split('.')):
+                node = node.setdefault(label, {})
+            node['!'] = rule.startswith('!')
+        SUFFIX_TRIE = trie
+    return SUFFIX_TRIE
+
+@functools.lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def registered_domain(domain: str, service: bool = False):
+    # Validates `domain` and returns its registered domain (public suffix plus one
+    # label) in a single right-to-left pass over the labels, or None if the name is
+    # invalid or its TLD is unknown. Same answers as `validators.domain` followed by
+    # `publicsuffix2.get_sld(domain, strict=True)`. With `service`, the first label may start
+    # with underscores (_dmarc, _spf, ...).
+    checked = domain.lstrip('_') if service else domain
+    if checked.isascii():
+        encoded = checked.lower()
+    else:
+        try:
+            encoded = checked.encode('idna').decode()
+        except UnicodeError:
+            return None
+    if len(encoded) > 253:
+        return None
+    encoded_labels = encoded.split('.')
+    labels = domain.lower().split('.')
+    if len(labels) < 2:
+        return None
+    nodes = [suffix_trie()]
+    suffix = 0
+    for depth in range(1, len(labels) + 1):
+        if not (TLD_LABEL if depth == 1 else LABEL).fullmatch(encoded_labels[-depth]):
+            return None
+        if nodes:
+            # Follow wildcard and literal rules side by side; the last rule reached
+            # at a depth decides whether it is a suffix or an exception
+            label = labels[-depth]
+            nodes = [child for node in nodes for child in (node.get('*'), node.get(label)) if child is not None]
+            if nodes and not nodes[-1].get('!', False):
+                suffix = depth
+            elif depth == 1:
+                return None
+    if len(labels) <= suffix:
+        return '.'.join(labels)
+    return '.'.join(labels[-suffix-1:])
+
 def valid_domain(domain):
-    return (validators.domain(domain) and psl.get_sld(domain, strict=True))
+    return registered_domain(domain)
 
-def make_query(query, qtype):
+def make_query(query, qtype, exact=False, udp_size=None):
+    # `exact` queries the name as given, e.g. `_dmarc.example.com`, instead of
+    # reducing NS/MX/TXT lookups to the registered domain. `udp_size` adds an EDNS(0)
+    # OPT record so the server may answer with up to that many bytes over UDP.
     if not (isinstance(query, str) and isinstance(qtype, str)):
         raise TypeError('Parameters must be instances of `str`')
     qtype = QTYPE.get(qtype.upper(), None)
     if not qtype:
         raise ValueError('QTYPE is invalid or unsupported')
     if qtype == 12:
+        import validators
         if validators.ipv4(query):
             query = ipaddress.IPv4Address(query).reverse_pointer
         elif validators.ipv6(query):
@@ -148,21 +281,25 @@ def make_query(query, qtype):
         else:
             raise ValueError('QUERY is not a valid IPv4 or IPv6 address')
     else:
-        if not (validators.domain(query) and (sld := psl.get_sld(query, strict=True))):
+        # A leading underscore label (_dmarc, _spf, ...) is allowed in front of a valid domain
+        if not (sld := registered_domain(query, service=True)):
             raise ValueError('QUERY is not a valid web domain')
-        if qtype in (2, 15, 16):
+        if qtype in (2, 15, 16) and not exact:
             query = sld
     return b''.join([
-        random.randbytes(2), b'\1\0\0\1\0\0\0\0\0\0',
+        random.randbytes(2), b'\1\0\0\1\0\0\0\0\0', b'\1' if udp_size else b'\0',
         ''.join(chr(len(i)) + i for i in query.split('.')).encode('utf8'),
-        b'\0', qtype.to_bytes(2, 'big'), b'\0\1'
+        b'\0', qtype.to_bytes(2, 'big'), b'\0\1',
+        opt_record(udp_size) if udp_size else b''
     ])
 
 class DNS_Parser:
-    def __init__(self, response: bytes) -> None:
+    def __init__(self, response: bytes, validate: bool = True) -> None:
         if not isinstance(response, bytes):
             raise TypeError('Argument must be an instance of `bytes`')
         self.response = response
+        # Answers from a trusted upstream can skip validating CNAME/NS/PTR/MX names
+        self.validate = validate
         self.names = dict()
         self.question = dict()
         self.answers = []
@@ -177,51 +314,19 @@ class DNS_Parser:
         if pos >= len(self.response):
             raise IndexError('Index exceeds the maximum possible value')
     
-    def read_stream(self, pos: int, recur: bool=False, length: int=0) -> str:
-        self.check_bounds(pos)
-        chunks = []
-        count = 0
-        while True:
-            hint = self.response[pos]
-            if hint == 0:
-                if not recur:
-                    self.position = pos
-                break
-            elif hint == 192:
-                index = self.response[pos+1]
-                self.position = pos+1
-                if index in self.names:
-                    name = self.names[index]
-                else:
-                    name = self.read_stream(index, True)
-                    self.names[index] = name
-                chunks.append(name)
-                pos += 2
-                count += 2
-                if not length or count == length:
-                    break
-                else:
-                    continue 
-            pos += 1
-            count += 1
-            chunk = self.response[pos:pos+hint].decode('utf8')
-            chunks.append(chunk)
-            pos += hint
-            count += hint
-        return '.'.join(chunks)
+    def read_stream(self, pos: int) -> str:
+        # Decodes the name at `pos` and leaves self.position on its last byte (the
+        # terminating zero or the second byte of a pointer)
+        name, end = decode_name(self.response, pos, self.names)
+        self.position = end - 1
+        return name
     
     def parse_dns_query(self):
         pos = self.response[12:].index(0)
         query = self.response[:pos+17]
-        headers = [f(query[:12][i:i+2]) for f, i in zip(DECODE_HEADER, range(0, 12, 2))]
-        self.question = dict(zip(HEADERS, headers))
-        flags = self.question['Flags']
-        self.question['Flags'] = {
-            'Hexadecimal': flags, 'Binary': f'{int(flags, 16):016b}',
-            'Breakdown': decode_flags(flags)
-        }
+        ident, flags, *counts = HEADER.unpack_from(query)
+        self.question = dict(zip(HEADERS, [ident.hex(), HeaderFlags(flags), *counts]))
         name = self.read_stream(12)
-        self.names[12] = name
         qtype = QTYPE[byte2int(query[pos+13:pos+15])]
         self.position = pos + 16
         self.question.update({
@@ -239,10 +344,18 @@ class DNS_Parser:
     
     def rdata_txt(self, pos: int, length: int) -> dict:
         self.check_bounds(pos+length-1)
-        return {'Text length': self.response[pos], 'Text': self.response[pos+1:pos+length+1].decode('utf8')}
+        # Records longer than 255 bytes (SPF, DKIM) are split into several character-strings
+        strings, end = [], pos+length
+        while pos < end:
+            strings.append(self.response[pos+1:pos+1+self.response[pos]])
+            pos += 1 + self.response[pos]
+        if pos != end:
+            raise ValueError('DNS message is malformed or invalid')
+        text = b''.join(strings)
+        return {'Text length': len(text), 'Text': text.decode('utf8')}
     
     def rdata_mx(self, pos: int, length: int) -> dict:
-        return {'Preference': byte2int(self.response[pos:pos+2]), 'Mail Exchange': self.read_stream(pos+2, length-2)}
+        return {'Preference': byte2int(self.response[pos:pos+2]), 'Mail Exchange': self.read_stream(pos+2)}
     
     # def rdata_soa(self, pos: int) -> dict:
     #     pns = self.read_stream(pos)
@@ -262,6 +375,13 @@ class DNS_Parser:
         answer.update(headers)
         qtype = headers['QType']
         length = headers['Data length']
+        if qtype == 'OPT':
+            self.check_bounds(self.position+10+length)
+            options = self.response[self.position+11:self.position+11+length]
+            answer['RData'] = decode_opt(headers['QClass'], headers['Time-to-live'], options)
+            self.answers.append(answer)
+            self.position += 10 + length
+            return
         if length == 0:
             raise ValueError('DNS message is malformed or invalid')
         if qtype == 'A':
@@ -276,12 +396,13 @@ class DNS_Parser:
             self.position += 26
         elif qtype == 'TXT':
             rdata = self.rdata_txt(self.position+11, length)
-            if length - rdata['Text length'] != 1:
-                raise ValueError('DNS message is malformed or invalid')
             self.position += (10 + length)
         elif qtype in ('CNAME', 'NS', 'PTR'):
-            rdata = self.read_stream(self.position+11, length)
-            if not valid_domain(rdata):
+            end = self.position + 10 + length
+            rdata = self.read_stream(self.position+11)
+            if self.position != end:
+                raise ValueError('DNS message is malformed or invalid')
+            if self.validate and not valid_domain(rdata):
                 raise ValueError('DNS message is malformed or invalid')
         elif qtype == 'MX':
             if length == 3 and self.response[self.position+13] == 0:
@@ -289,9 +410,12 @@ class DNS_Parser:
                 rdata = {'Preference': prefs, 'Mail Exchange': '<Root>'}
                 self.position += 13
             else:
+                end = self.position + 10 + length
                 rdata = self.rdata_mx(self.position+11, length)
+                if self.position != end:
+                    raise ValueError('DNS message is malformed or invalid')
                 mx = rdata['Mail Exchange']
-                if not valid_domain(mx):
+                if self.validate and not valid_domain(mx):
                     raise ValueError('DNS message is malformed or invalid')
         # elif qtype == 'SOA':
         #     rdata = self.rdata_soa(self.position+11)
@@ -318,18 +442,206 @@ class DNS_Parser:
         # if self.soa:
         #     self.raw['Authorative Answers'] = self.soa
 
+HEADER = struct.Struct('!2sHHHHH')
+QUESTION_FIELDS = struct.Struct('!HH')
+RR_FIELDS = struct.Struct('!HHIH')
+PREFERENCE = struct.Struct('!H')
+
+class Question:
+    __slots__ = ('name', 'qtype', 'qclass')
+
+    def __init__(self, name: str, qtype: int, qclass: int) -> None:
+        self.name = name
+        self.qtype = qtype
+        self.qclass = qclass
+
+    def __repr__(self) -> str:
+        return f'Question({self.name!r}, {QTYPE.get(self.qtype, self.qtype)!r})'
+
+class ResourceRecord:
+    __slots__ = ('name', 'rtype', 'rclass', 'ttl', 'length', 'rdata')
+
+    def __init__(self, name: str, rtype: int, rclass: int, ttl: int, length: int, rdata) -> None:
+        self.name = name
+        self.rtype = rtype
+        self.rclass = rclass
+        self.ttl = ttl
+        self.length = length
+        # str for A/AAAA/CNAME/NS/PTR/TXT, (preference, exchange) for MX, raw bytes otherwise
+        self.rdata = rdata
+
+    def __repr__(self) -> str:
+        return f'ResourceRecord({self.name!r}, {QTYPE.get(self.rtype, self.rtype)!r}, {self.rdata!r})'
+
+    def to_dict(self) -> dict:
+        rtype = QTYPE.get(self.rtype, self.rtype)
+        if rtype == 'OPT':
+            return {
+                'QName': self.name,
+                'QType': rtype,
+                'QClass': self.rclass,
+                'Time-to-live': self.ttl,
+                'Data length': self.length,
+                'RData': decode_opt(self.rclass, self.ttl, self.rdata)
+            }
+        if rtype == 'TXT':
+            # In bytes, like DNS_Parser
+            rdata = {'Text length': len(self.rdata.encode('utf8')), 'Text': self.rdata}
+        elif rtype == 'MX':
+            rdata = {'Preference': self.rdata[0], 'Mail Exchange': self.rdata[1]}
+        else:
+            rdata = self.rdata
+        return {
+            'QName': self.name,
+            'QType': rtype,
+            'QClass': dns_qclass(self.rclass),
+            'Time-to-live': self.ttl,
+            'Data length': self.length,
+            'RData': rdata
+        }
+
+class DNS_FastParser:
+    # Takes the same input as DNS_Parser and exposes the same `raw` layout, but decodes
+    # straight from a memoryview into Question/ResourceRecord objects and only builds
+    # the nested dicts when `raw` or `to_dict()` is actually used
+    def __init__(self, response: bytes, validate: bool = True) -> None:
+        if not isinstance(response, bytes):
+            raise TypeError('Argument must be an instance of `bytes`')
+        self.response = response
+        self.view = memoryview(response)
+        self.validate = validate
+        self.names = dict()
+        self.id = b''
+        self.flags = 0
+        self.counts = (0, 0, 0, 0)
+        self.questions = []
+        self.answers = []
+        self._raw = None
+
+    def read_name(self, pos: int) -> tuple:
+        # Returns the name and the offset just past it; decoded suffixes are shared
+        # through self.names
+        return decode_name(self.response, pos, self.names)
+
+    def read_rdata(self, rtype: int, pos: int, length: int):
+        view = self.view
+        if rtype == 1:
+            if length != 4:
+                raise ValueError('DNS message is malformed or invalid')
+            return socket.inet_ntop(socket.AF_INET, view[pos:pos+4])
+        if rtype == 28:
+            if length != 16:
+                raise ValueError('DNS message is malformed or invalid')
+            return socket.inet_ntop(socket.AF_INET6, view[pos:pos+16])
+        if rtype == 16:
+            chunks = []
+            end = pos + length
+            while pos < end:
+                hint = view[pos]
+                chunks.append(str(view[pos+1:pos+1+hint], 'utf8'))
+                pos += hint + 1
+            if pos != end:
+                raise ValueError('DNS message is malformed or invalid')
+            return ''.join(chunks)
+        if rtype in (2, 5, 12):
+            name = self.read_name(pos)[0]
+            if self.validate and not valid_domain(name):
+                raise ValueError('DNS message is malformed or invalid')
+            return name
+        if rtype == 15:
+            name = self.read_name(pos+2)[0]
+            if not name:
+                name = '<Root>'
+            elif self.validate and not valid_domain(name):
+                raise ValueError('DNS message is malformed or invalid')
+            return PREFERENCE.unpack_from(view, pos)[0], name
+        return bytes(view[pos:pos+length])
+
+    def parse_dns_response(self):
+        try:
+            self.parse_sections()
+        except (IndexError, struct.error):
+            # Cut off in the middle of a name or of fixed-size fields
+            raise ValueError('DNS message is malformed or invalid') from None
+        self._raw = None
+
+    def parse_sections(self):
+        view = self.view
+        self.id, self.flags, *counts = HEADER.unpack_from(view, 0)
+        self.counts = tuple(counts)
+        pos = 12
+        for _ in range(counts[0]):
+            name, pos = self.read_name(pos)
+            qtype, qclass = QUESTION_FIELDS.unpack_from(view, pos)
+            pos += 4
+            self.questions.append(Question(name, qtype, qclass))
+        for _ in range(sum(counts[1:])):
+            name, pos = self.read_name(pos)
+            rtype, rclass, ttl, length = RR_FIELDS.unpack_from(view, pos)
+            pos += 10
+            # Only OPT may have empty RDATA (an EDNS record without options)
+            if (length == 0 and rtype != 41) or pos + length > len(view):
+                raise ValueError('DNS message is malformed or invalid')
+            rdata = self.read_rdata(rtype, pos, length)
+            self.answers.append(ResourceRecord(name, rtype, rclass, ttl, length, rdata))
+            pos += length
+
+    def to_dict(self) -> dict:
+        questions, answers, authority, additional = self.counts
+        question = {
+            'ID': self.id.hex(),
+            'Flags': HeaderFlags(self.flags),
+            'Questions': questions,
+            'Answers': answers,
+            'Authorative Answers': authority,
+            'Additional Resources': additional
+        }
+        if self.questions:
+            first = self.questions[0]
+            question.update({
+                'Name': first.name, 'Type': QTYPE.get(first.qtype, first.qtype),
+                'Class': dns_qclass(first.qclass)
+            })
+        return {'Question': question, 'Answers': [answer.to_dict() for answer in self.answers]}
+
+    @property
+    def raw(self) -> dict:
+        if self._raw is None:
+            self._raw = self.to_dict()
+        return self._raw
+
+def recv_exact(sock: socket.socket, length: int) -> bytes:
+    chunks = []
+    while length:
+        chunk = sock.recv(length)
+        if not chunk:
+            raise ConnectionError('Connection closed before the full message arrived')
+        chunks.append(chunk)
+        length -= len(chunk)
+    return b''.join(chunks)
+
+def dns_query_tcp(request: bytes, address: str, timeout: float = 2) -> bytes:
+    # DNS over TCP: every message is prefixed with its 2-byte length
+    with socket.create_connection((address, 53), timeout=timeout) as sock:
+        sock.sendall(len(request).to_bytes(2, 'big') + request)
+        return recv_exact(sock, byte2int(recv_exact(sock, 2)))
+
 def dns_query(query, address, qtype):
-    request = make_query(query, qtype)
+    request = make_query(query, qtype, udp_size=EDNS_UDP_SIZE)
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     sock.settimeout(2)
     try:
         sock.sendto(request, (address, 53))
         response = sock.recv(8192)
+        if is_truncated(response):
+            response = dns_query_tcp(request, address)
     except Exception as e:
         print(e)
         return
     finally:
         sock.close()
+    if CAPTURE is not None:
+        CAPTURE.write(len(response).to_bytes(2, 'big') + response)
     parser = DNS_Parser(response)
     parser.parse_dns_response()
     
@@ -345,10 +657,8 @@ def dns_query(query, address, qtype):
     if 'Authorative Answers' in parser.raw:
         for answer in parser.raw['Authorative Answers']:
             print("RData:", answer.get('RData', 'N/A'))
+    return parser.raw
 
-address = "8.8.8.8"
-query = input("Domain name: ")  # Change this to the domain or IP address you want to query
-qtype = input("Record Type: ")  # Change this to the desired query type
-
-# Call the dns_query function
-dns_query(query, address, qtype)
+if __name__ == '__main__':
+    from query_cli import main
+    main()
@@ -0,0 +1,167 @@
+import argparse
+import asyncio
+import ipaddress
+import struct
+import sys
+import time
+from final import DNS_FastParser
+from resolver import DNS_Resolver, as_completed_bounded
+
+# Sweep file layout: MAGIC, one byte IP version (4 or 6), then one record per answer:
+# packed address (4 or 16 bytes), status byte, name length byte, name (ASCII).
+# Addresses without a PTR name still get a record with an empty name, so a /16
+# costs 6 bytes per address plus the names.
+MAGIC = b'PTRS'
+RECORD = struct.Struct('!BB')
+
+FOUND, NXDOMAIN, NO_PTR, FAILED = range(4)
+STATUS_NAMES = ['found', 'nxdomain', 'no_ptr', 'failed']
+
+
+def parse_networks(specs: list) -> list:
+    networks = [ipaddress.ip_network(spec, strict=False) for spec in specs]
+    if len({network.version for network in networks}) > 1:
+        raise ValueError('IPv4 and IPv6 networks have to be swept separately')
+    return networks
+
+
+def addresses(networks: list):
+    # Every address of every network, made one at a time from its integer value
+    # instead of materialising the list (a /16 alone is 65536 addresses)
+    for network in networks:
+        first = int(network.network_address)
+        address_class = type(network.network_address)
+        for offset in range(network.num_addresses):
+            yield address_class(first + offset)
+
+
+class RateLimiter:
+    # Spaces queries 1/rate seconds apart; idle time is not saved up for a burst
+    def __init__(self, rate: float) -> None:
+        self.interval = 1 / rate
+        self.next = 0.0
+
+    async def wait(self):
+        now = asyncio.get_running_loop().time()
+        self.next = max(self.next, now)
+        delay = self.next - now
+        self.next += self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def lookup_ptr(resolver: DNS_Resolver, limiter: RateLimiter, address) -> tuple:
+    await limiter.wait()
+    try:
+        response = await resolver.query(str(address), 'PTR')
+        # PTR names in the wild often break hostname rules; they are reported as given
+        parser = DNS_FastParser(response, validate=False)
+        parser.parse_dns_response()
+    except Exception:
+        return address, FAILED, []
+    rcode = parser.flags & 0xF
+    if rcode == 3:
+        return address, NXDOMAIN, []
+    if rcode:
+        return address, FAILED, []
+    names = [answer.rdata for answer in parser.answers if answer.rtype == 12]
+    return address, FOUND if names else NO_PTR, names
+
+
+class SweepWriter:
+    def __init__(self, path: str, version: int) -> None:
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + bytes([version]))
+
+    def write(self, address, status: int, names: list):
+        packed = address.packed
+        if not names:
+            self.file.write(packed + RECORD.pack(status, 0))
+        for name in names:
+            encoded = name.encode('ascii', errors='replace')[:255]
+            self.file.write(packed + RECORD.pack(status, len(encoded)) + encoded)
+
+    def close(self):
+        self.file.close()
+
+
+def read_sweep(path: str):
+    # Yields (address, status, name) for every record of a sweep file
+    with open(path, 'rb') as sweep:
+        header = sweep.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'{path} is not a PTR sweep file')
+        address_class = ipaddress.IPv4Address if header[-1] == 4 else ipaddress.IPv6Address
+        size = 4 if header[-1] == 4 else 16
+        while True:
+            head = sweep.read(size + RECORD.size)
+            if len(head) < size + RECORD.size:
+                # End of file, or a record cut short by an interrupted sweep
+                break
+            status, length = RECORD.unpack_from(head, size)
+            name = sweep.read(length).decode('ascii')
+            yield address_class(head[:size]), STATUS_NAMES[status], name or None
+
+
+async def sweep(networks: list, resolver: DNS_Resolver, writer: SweepWriter, concurrency: int, rate: float) -> dict:
+    limiter = RateLimiter(rate)
+    counts = dict.fromkeys(STATUS_NAMES, 0)
+    jobs = (lookup_ptr(resolver, limiter, address) for address in addresses(networks))
+    async for address, status, names in as_completed_bounded(jobs, concurrency):
+        writer.write(address, status, names)
+        counts[STATUS_NAMES[status]] += 1
+    return counts
+
+
+async def run_sweep(args):
+    networks = parse_networks(args.networks)
+    total = sum(network.num_addresses for network in networks)
+    resolver = DNS_Resolver(args.server, args.port, timeout=args.timeout, retries=args.retries,
+                            concurrency=args.concurrency)
+    writer = SweepWriter(args.output, networks[0].version)
+    start = time.perf_counter()
+    try:
+        async with resolver:
+            counts = await sweep(networks, resolver, writer, args.concurrency, args.rate)
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - start
+    summary = ', '.join(f'{status} {count}' for status, count in counts.items())
+    print(f'{total} addresses in {elapsed:.1f}s ({total / elapsed:.0f} q/s): {summary}', file=sys.stderr)
+
+
+def dump(args):
+    for address, status, name in read_sweep(args.input):
+        if name:
+            print(f'{address}\t{name}')
+        elif args.all:
+            print(f'{address}\t<{status}>')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Sweep IP ranges for reverse DNS (PTR) records')
+    commands = arg_parser.add_subparsers(dest='command', required=True)
+
+    sweep_parser = commands.add_parser('sweep', help='query the PTR record of every address in some networks')
+    sweep_parser.add_argument('networks', nargs='+', help='CIDR blocks, e.g. 192.0.2.0/24')
+    sweep_parser.add_argument('-o', '--output', required=True, help='sweep file to write')
+    sweep_parser.add_argument('--server', default='8.8.8.8')
+    sweep_parser.add_argument('--port', type=int, default=53)
+    sweep_parser.add_argument('-c', '--concurrency', type=int, default=500, help='queries in flight at once')
+    sweep_parser.add_argument('--rate', type=float, default=1000, help='queries per second')
+    sweep_parser.add_argument('--timeout', type=float, default=2.0)
+    sweep_parser.add_argument('--retries', type=int, default=2)
+
+    dump_parser = commands.add_parser('dump', help='print a sweep file as text')
+    dump_parser.add_argument('input')
+    dump_parser.add_argument('--all', action='store_true', help='also list addresses without a name')
+
+    args = arg_parser.parse_args()
+    if args.command == 'sweep':
+        asyncio.run(run_sweep(args))
+    else:
+        dump(args)
+
+
+if __name__ == '__main__':
+    main()
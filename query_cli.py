@@ -0,0 +1,35 @@
+import argparse
+import final
+from final import DNS_SERVERS, dns_query
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Look up a DNS record and print the answer')
+    arg_parser.add_argument('query', nargs='?', help='domain name, or an IPv4/IPv6 address for PTR')
+    arg_parser.add_argument('qtype', nargs='?', help='record type, e.g. A, AAAA, MX, NS, TXT, PTR')
+    arg_parser.add_argument('--server', action='append',
+                            help='resolver to ask; repeat to fall back in order '
+                                 f'(default: {", ".join(DNS_SERVERS)})')
+    arg_parser.add_argument('--capture', metavar='FILE',
+                            help='append the raw response to a corpus file (see dns_corpus.py)')
+    args = arg_parser.parse_args(argv)
+
+    # Anything not given on the command line is asked for interactively
+    query = args.query or input('Domain name: ')
+    qtype = args.qtype or input('Record Type: ')
+
+    if args.capture:
+        final.CAPTURE = open(args.capture, 'ab')
+    try:
+        # Try each server until one answers
+        for address in args.server or DNS_SERVERS:
+            if dns_query(query, address, qtype) is not None:
+                break
+    finally:
+        if final.CAPTURE is not None:
+            final.CAPTURE.close()
+            final.CAPTURE = None
+
+
+if __name__ == '__main__':
+    main()
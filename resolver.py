@@ -0,0 +1,79 @@
+from final import make_query, DNS_Parser, DNS_FastParser, EDNS_UDP_SIZE
+# The same bounded window and socket pools as the DNS/ apps
+from DNS.dnsnet.bounded import as_completed_bounded
+from DNS.dnsnet.dns_wire import is_truncated
+from DNS.dnsnet.tcp_pool import TCPPool
+from DNS.dnsnet.udp_pool import UDPPool
+
+
+# Large kernel buffers so bursts of replies are not dropped before the loop reads them
+RECV_BUFFER = 1 << 20
+
+
+class DNS_Resolver:
+    def __init__(self, address: str = '8.8.8.8', port: int = 53, sockets: int = 4,
+                 timeout: float = 2.0, retries: int = 2, concurrency: int = 1000,
+                 fast: bool = False, udp_size: int = EDNS_UDP_SIZE, validate: bool = True) -> None:
+        self.address = address
+        self.port = port
+        self.sockets = sockets
+        self.timeout = timeout
+        self.retries = retries
+        self.concurrency = concurrency
+        self.parser = DNS_FastParser if fast else DNS_Parser
+        # False skips validating names in answers, for upstreams that are trusted
+        self.validate = validate
+        # EDNS(0) payload size advertised in every query; None sends plain 512-byte queries
+        self.udp_size = udp_size
+        # The UDP sockets match replies to queries by (socket, ID) and question;
+        # truncated answers are retried over pipelined TCP connections
+        self.udp = UDPPool(address, port, size=sockets, timeout=timeout, retries=retries,
+                           max_in_flight=concurrency, recv_buffer=RECV_BUFFER)
+        self.tcp = TCPPool(address, port, timeout=timeout)
+
+    async def open(self):
+        await self.udp.ensure_open()
+        return self
+
+    def close(self):
+        self.udp.close()
+        self.tcp.close()
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    async def query(self, query: str, qtype: str, exact: bool = False) -> bytes:
+        if not self.udp.protocols:
+            raise RuntimeError('Resolver is not open')
+        request = make_query(query, qtype, exact, self.udp_size)
+        response = await self.udp.request(request)
+        if is_truncated(response):
+            # Large answers (long TXT/SPF records) are fetched again over TCP
+            response = await self.tcp.request(request)
+        return response
+
+    async def resolve(self, query: str, qtype: str, exact: bool = False) -> dict:
+        response = await self.query(query, qtype, exact)
+        parser = self.parser(response, validate=self.validate)
+        parser.parse_dns_response()
+        return parser.raw
+
+    async def _resolve_or_error(self, query: str, qtype: str) -> dict:
+        try:
+            return await self.resolve(query, qtype)
+        except Exception as e:
+            return {'Question': {'Name': query, 'Type': qtype}, 'Error': str(e)}
+
+    async def resolve_many(self, queries):
+        # Pulls (name, qtype) pairs lazily so at most `concurrency` queries are in flight
+        lookups = (self._resolve_or_error(query, qtype) for query, qtype in queries)
+        async for result in as_completed_bounded(lookups, self.concurrency):
+            yield result
+
+async def resolve_many(queries, address: str = '8.8.8.8', **kwargs):
+    async with DNS_Resolver(address, **kwargs) as resolver:
+        async for result in resolver.resolve_many(queries):
+            yield result
@@ -0,0 +1,224 @@
+import argparse
+import sys
+from sqlalchemy import bindparam, case, func, insert, select, update
+import models
+from database import SessionLocal
+from report import calculate_grade, grade, overall_score
+
+# student_totals holds each student's overall score (indexed, so the top scorers
+# are an index scan) and first marks row; grade_counts holds the grade distribution
+# of the report. Both are updated in the transaction that inserts marks, so reading
+# them never touches the marks table. `python aggregates.py check|rebuild` compares
+# them with the marks table or recomputes them from it.
+
+SUBJECTS = ("sub1", "sub2", "sub3")
+GRADES = ("A", "B", "C", "D", "F")
+# Key of the PostgreSQL advisory lock taken by rebuild_if_missing
+REBUILD_LOCK_KEY = 7305342
+
+student_totals = models.StudentTotal.__table__
+grade_counts = models.GradeCount.__table__
+
+
+def record_marks(db, rows):
+    # Adds freshly inserted (flushed, so they have ids) Marks rows to the aggregates
+    totals = {}
+    for marks in rows:
+        total = totals.setdefault(marks.student_id, {"score": 0, "count": 0, "first": marks})
+        total["score"] += marks.sub1 + marks.sub2 + marks.sub3
+        total["count"] += 1
+        if marks.id < total["first"].id:
+            total["first"] = marks
+
+    # Lock the students' rows first, so concurrent requests adding marks for the same
+    # student take turns and the later one sees the total the earlier one created
+    # rather than inserting a second. FOR NO KEY UPDATE (key_share) leaves alone the
+    # KEY SHARE locks that inserting the marks already took on these rows; sorting
+    # keeps batches that share students from deadlocking. SQLite ignores the clause,
+    # it only ever has one writer.
+    db.execute(
+        select(models.Student.roll_no).where(models.Student.roll_no.in_(sorted(totals)))
+        .order_by(models.Student.roll_no).with_for_update(key_share=True)
+    ).all()
+    existing = dict(db.execute(
+        select(models.StudentTotal.student_id, models.StudentTotal.first_marks_id)
+        .where(models.StudentTotal.student_id.in_(totals))
+    ).all())
+    increments = [
+        {"key": student_id, "score": total["score"], "count": total["count"], "first": total["first"].id}
+        for student_id, total in totals.items() if student_id in existing
+    ]
+    if increments:
+        # The lock order, not the order the marks were inserted in, decides who comes
+        # first: a request that inserted its marks earlier may get here after one that
+        # created the total, so the first marks row can still move back (LEAST, spelled
+        # as a CASE for SQLite)
+        first = bindparam("first", type_=student_totals.c.first_marks_id.type)
+        db.connection().execute(
+            update(student_totals).where(student_totals.c.student_id == bindparam("key")).values(
+                overall_score=student_totals.c.overall_score + bindparam("score"),
+                marks_count=student_totals.c.marks_count + bindparam("count"),
+                first_marks_id=case((first < student_totals.c.first_marks_id, first),
+                                    else_=student_totals.c.first_marks_id),
+            ),
+            increments,
+        )
+
+    # Students without a total yet are getting their first marks, the ones the report grades
+    firsts = [(student_id, total) for student_id, total in totals.items() if student_id not in existing]
+    if firsts:
+        db.connection().execute(insert(student_totals), [
+            {"student_id": student_id, "overall_score": total["score"], "marks_count": total["count"],
+             "first_marks_id": total["first"].id}
+            for student_id, total in firsts
+        ])
+    # Students whose first marks row moved back are graded by the new row instead
+    replaced = {
+        existing[student_id]: total["first"] for student_id, total in totals.items()
+        if student_id in existing and total["first"].id < existing[student_id]
+    }
+    if not firsts and not replaced:
+        return
+    grades = {}
+
+    def tally(marks, students):
+        for subject in SUBJECTS:
+            key = (subject, calculate_grade(getattr(marks, subject)))
+            grades[key] = grades.get(key, 0) + students
+
+    for student_id, total in firsts:
+        tally(total["first"], 1)
+    for old in db.scalars(select(models.Marks).where(models.Marks.id.in_(replaced))):
+        tally(old, -1)
+        tally(replaced[old.id], 1)
+    changes = [
+        {"key_subject": subject, "key_grade": letter, "count": count}
+        for (subject, letter), count in grades.items() if count
+    ]
+    if changes:
+        db.connection().execute(
+            update(grade_counts).where(
+                (grade_counts.c.subject == bindparam("key_subject")) & (grade_counts.c.grade == bindparam("key_grade"))
+            ).values(students=grade_counts.c.students + bindparam("count")),
+            changes,
+        )
+
+
+def top_scores(db, n=10) -> list:
+    rows = db.query(
+        models.StudentTotal.student_id, models.Student.name, models.StudentTotal.overall_score
+    ).join(
+        models.Student, models.Student.roll_no == models.StudentTotal.student_id
+    ).order_by(
+        models.StudentTotal.overall_score.desc(), models.StudentTotal.student_id
+    ).limit(n)
+    return [
+        {"student_id": student_id, "student_name": name, "overall_score": score}
+        for student_id, name, score in rows
+    ]
+
+
+def grade_distribution(db) -> dict:
+    distribution = {subject: dict.fromkeys(GRADES, 0) for subject in SUBJECTS}
+    for count in db.query(models.GradeCount):
+        distribution[count.subject][count.grade] = count.students
+    return distribution
+
+
+def computed_totals():
+    # student_totals as computed from the marks table
+    return select(
+        models.Marks.student_id,
+        overall_score().label("overall_score"),
+        func.count(models.Marks.id).label("marks_count"),
+        func.min(models.Marks.id).label("first_marks_id"),
+    ).where(models.Marks.student_id.isnot(None)).group_by(models.Marks.student_id)
+
+
+def computed_grade_counts(db) -> dict:
+    counts = {(subject, letter): 0 for subject in SUBJECTS for letter in GRADES}
+    first = select(func.min(models.Marks.id).label("id")).where(
+        models.Marks.student_id.isnot(None)
+    ).group_by(models.Marks.student_id).subquery()
+    for subject in SUBJECTS:
+        rows = db.execute(
+            select(grade(getattr(models.Marks, subject)).label("grade"), func.count().label("students"))
+            .join(first, first.c.id == models.Marks.id)
+            .group_by("grade")
+        )
+        for letter, students in rows:
+            counts[(subject, letter)] = students
+    return counts
+
+
+def rebuild(db):
+    db.execute(grade_counts.delete())
+    db.execute(student_totals.delete())
+    db.execute(insert(student_totals).from_select(
+        ["student_id", "overall_score", "marks_count", "first_marks_id"], computed_totals()
+    ))
+    db.execute(insert(grade_counts), [
+        {"subject": subject, "grade": letter, "students": students}
+        for (subject, letter), students in computed_grade_counts(db).items()
+    ])
+    db.commit()
+
+
+def rebuild_if_missing(db):
+    # grade_counts always has a row per subject and grade once built, so an empty
+    # table means the aggregates were just created next to existing marks. Every app
+    # worker calls this at startup; the advisory lock (held until the transaction
+    # ends) makes the others wait for the first one's rebuild and then find it done
+    # rather than run their own. SQLite only ever has one writer anyway.
+    if db.get_bind().dialect.name == "postgresql":
+        db.execute(select(func.pg_advisory_xact_lock(REBUILD_LOCK_KEY)))
+    if db.query(models.GradeCount).first() is None:
+        rebuild(db)
+    db.commit()
+
+
+def check(db) -> list:
+    # Differences between the aggregates and the marks table, empty if consistent
+    problems = []
+    expected = {row.student_id: row for row in db.execute(computed_totals())}
+    actual = {row.student_id: row for row in db.execute(select(student_totals))}
+    for student_id in expected.keys() | actual.keys():
+        want, have = expected.get(student_id), actual.get(student_id)
+        if want is None or have is None:
+            problems.append(f"student {student_id}: total {'missing' if have is None else 'without marks'}")
+        elif (want.marks_count, want.first_marks_id) != (have.marks_count, have.first_marks_id):
+            problems.append(f"student {student_id}: marks count/first marks {have.marks_count}/{have.first_marks_id}, "
+                            f"expected {want.marks_count}/{want.first_marks_id}")
+        # Added up one marks row at a time, so allow for rounding
+        elif abs((want.overall_score or 0) - (have.overall_score or 0)) > 1e-6 * max(1, abs(want.overall_score or 0)):
+            problems.append(f"student {student_id}: overall score {have.overall_score}, expected {want.overall_score}")
+    distribution = grade_distribution(db)
+    for (subject, letter), students in computed_grade_counts(db).items():
+        if distribution[subject][letter] != students:
+            problems.append(f"{subject} grade {letter}: {distribution[subject][letter]} students, expected {students}")
+    return problems
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Check or rebuild the report aggregates from the marks table')
+    arg_parser.add_argument('command', choices=['check', 'rebuild'])
+    args = arg_parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.command == 'rebuild':
+            rebuild(db)
+            print('aggregates rebuilt')
+            return
+        problems = check(db)
+        for problem in problems:
+            print(problem)
+        if problems:
+            sys.exit(f'{len(problems)} inconsistencies, run `python aggregates.py rebuild`')
+        print('aggregates are consistent')
+    finally:
+        db.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+import csv
+import io
+from fastapi import HTTPException, Request
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+import models
+from aggregates import record_marks
+
+# Rows written per INSERT (sent as multi-row VALUES) and per commit
+BULK_BATCH = 1000
+
+
+async def read_rows(request: Request) -> list:
+    # A JSON array of objects, a CSV body (Content-Type: text/csv) or a CSV file
+    # uploaded as the `file` field of a form; CSV files need a header line
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if upload is None or isinstance(upload, str):
+            raise HTTPException(status_code=422, detail="Expected a CSV file in the `file` field")
+        return list(csv.DictReader(io.StringIO((await upload.read()).decode("utf-8-sig"))))
+    if content_type.startswith("text/csv"):
+        return list(csv.DictReader(io.StringIO((await request.body()).decode("utf-8-sig"))))
+    try:
+        rows = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Expected a JSON array or a CSV upload")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=422, detail="Expected a JSON array or a CSV upload")
+    return rows
+
+
+def validate_rows(rows: list, model) -> tuple:
+    # Returns [(row number, model instance)] and the errors of the rows that failed;
+    # rows are numbered from 1 in the order they were sent
+    entries, errors = [], []
+    for number, row in enumerate(rows, 1):
+        try:
+            entries.append((number, model.model_validate(row)))
+        except ValidationError as e:
+            detail = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+            errors.append({"row": number, "error": detail})
+    return entries, errors
+
+
+def batches(entries: list, size: int):
+    for i in range(0, len(entries), size):
+        yield entries[i:i+size]
+
+
+def insert_students(db, entries: list, errors: list, batch_size=BULK_BATCH) -> int:
+    inserted = 0
+    for batch in batches(entries, batch_size):
+        # Roll numbers already taken, in one query per batch; that includes the ones
+        # committed by earlier batches, while a batch that was rolled back frees its
+        # roll numbers again
+        taken = set(db.scalars(
+            select(models.Student.roll_no).where(models.Student.roll_no.in_([student.roll_no for _, student in batch]))
+        ))
+        # Repeats within this batch
+        seen = set()
+        rows = []
+        for number, student in batch:
+            if student.roll_no in taken or student.roll_no in seen:
+                errors.append({"row": number, "error": f"Student {student.roll_no} already exists"})
+                continue
+            seen.add(student.roll_no)
+            rows.append({"roll_no": student.roll_no, "name": student.name, "age": student.age})
+
+        def write():
+            if rows:
+                db.execute(insert(models.Student), rows)
+        inserted += write_batch(db, batch, errors, write, len(rows))
+    return inserted
+
+
+def insert_marks(db, entries: list, errors: list, batch_size=BULK_BATCH) -> int:
+    inserted = 0
+    for batch in batches(entries, batch_size):
+        # Foreign key check for the whole batch in one query
+        known = set(db.scalars(
+            select(models.Student.roll_no).where(models.Student.roll_no.in_({marks.student_id for _, marks in batch}))
+        ))
+        rows = []
+        for number, marks in batch:
+            if marks.student_id not in known:
+                errors.append({"row": number, "error": f"Student {marks.student_id} Not Found"})
+                continue
+            rows.append({"sub1": marks.sub1, "sub2": marks.sub2, "sub3": marks.sub3, "student_id": marks.student_id})
+
+        def write():
+            if rows:
+                # RETURNING hands back the new rows with their ids for the report aggregates
+                record_marks(db, db.scalars(insert(models.Marks).returning(models.Marks), rows).all())
+        inserted += write_batch(db, batch, errors, write, len(rows))
+    return inserted
+
+
+def write_batch(db, batch: list, errors: list, write, count: int) -> int:
+    # Commits one batch; if the database still refuses it (e.g. a roll number taken
+    # by a concurrent request) the batch is rolled back and reported row by row
+    try:
+        write()
+        db.commit()
+    except SQLAlchemyError as e:
+        db.rollback()
+        reported = {error["row"] for error in errors}
+        errors.extend(
+            {"row": number, "error": f"Batch rejected by the database: {type(e).__name__}"}
+            for number, _ in batch if number not in reported
+        )
+        return 0
+    return count
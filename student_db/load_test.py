@@ -0,0 +1,75 @@
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+
+# Requests/sec of POST /student and GET /reportt. By default the app is driven in
+# process through httpx's ASGI transport; --base-url measures a running server
+# instead, e.g. `uvicorn main:app --workers 1` started from two revisions to
+# compare them. DATABASE_URL (see database.py) selects the database in both cases.
+
+
+async def run(client, requests, concurrency, request):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await request(client, i)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return time.perf_counter() - start, latencies
+
+
+def report(label, elapsed, latencies):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies) * 1000
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(f"{label:<22} n={len(latencies):<6} {len(latencies) / elapsed:8.1f} req/s  p50={p50:8.2f} ms  p99={p99:8.2f} ms")
+
+
+def post_student(first_roll):
+    def request(client, i):
+        return client.post("/student", json={"roll_no": first_roll + i, "name": f"load{i}", "age": 20})
+    return request
+
+
+def get_report(client, i):
+    return client.get("/reportt")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Requests/sec of /student and /reportt")
+    parser.add_argument("--base-url", help="running server to measure (default: the app in process)")
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="/student requests")
+    parser.add_argument("--report-requests", type=int, default=200, help="/reportt requests")
+    parser.add_argument("-c", "--concurrency", type=int, default=50)
+    parser.add_argument("--first-roll", type=int, default=10_000_000, help="roll_no of the first student posted")
+    parser.add_argument("--seed", type=int, help="DROP and reseed the tables of DATABASE_URL with this many "
+                                                 "students first (scratch databases only)")
+    args = parser.parse_args()
+
+    if args.seed:
+        from database import engine
+        from bench_report import seed
+        seed(engine, args.seed)
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=60,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        import main as app_module
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app_module.app), base_url="http://test", timeout=60)
+
+    async with client:
+        report("POST /student", *await run(client, args.requests, args.concurrency, post_student(args.first_roll)))
+        report("GET /reportt", *await run(client, args.report_requests, args.concurrency, get_report))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,14 +1,19 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, status
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Annotated
 import models
-from database import engine, SessionLocal
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from database import engine, SessionLocal, AsyncSessionLocal
+from sqlalchemy.ext.asyncio import AsyncSession
+from report import build_report, report_page, stream_report
+from aggregates import grade_distribution, rebuild_if_missing, record_marks, top_scores
+from bulk import BULK_BATCH, insert_marks, insert_students, read_rows, validate_rows
 
 
 app=FastAPI()
 models.Base.metadata.create_all(bind=engine)
+with SessionLocal() as db:
+    rebuild_if_missing(db)
 
 # class Marks(BaseModel):
 #     sub1:float
@@ -31,14 +36,20 @@ class Student(BaseModel):
     age:int
     #marks :List[Marks]
 
-def get_db():
-    db=SessionLocal()
-    try:
+class MarksEntry(BaseModel):
+    student_id:int
+    sub1:float
+    sub2:float
+    sub3:float
+
+# Handlers get an AsyncSession, so waiting on the database never blocks the event
+# loop. The query code in report.py, aggregates.py and bulk.py is written against
+# the sync Session API and runs on the same connection through run_sync().
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-db_dependency = Annotated[Session, Depends(get_db)]
+db_dependency = Annotated[AsyncSession, Depends(get_db)]
 
 @app.post("/student")
 async def enter_student_data(student: Student, db:db_dependency):
@@ -48,13 +59,13 @@ async def enter_student_data(student: Student, db:db_dependency):
         age=student.age
     )
     db.add(db_student)
-    db.commit()
-    db.refresh(db_student)
+    await db.commit()
+    await db.refresh(db_student)
 
 
 @app.post("/marks")
 async def enter_student_marks(student_id:int, marks:Marks, db:db_dependency):
-    db_student=db.query(models.Student).filter(models.Student.roll_no == student_id).first()
+    db_student=await db.get(models.Student, student_id)
 
     if not db_student:
         raise HTTPException(status_code=404, detail="Student Not Found")
@@ -66,7 +77,24 @@ async def enter_student_marks(student_id:int, marks:Marks, db:db_dependency):
         student_id=db_student.roll_no
         )
     db.add(db_marks)
-    db.commit()
+    await db.flush()
+    await db.run_sync(record_marks, [db_marks])
+    await db.commit()
+
+@app.post("/students/bulk")
+async def enter_students_bulk(request:Request, db:db_dependency, batch_size:Annotated[int, Query(ge=1, le=10000)]=BULK_BATCH):
+    # JSON array or CSV (roll_no,name,age); bad rows are reported, the rest are inserted
+    entries, errors = validate_rows(await read_rows(request), Student)
+    inserted = await db.run_sync(insert_students, entries, errors, batch_size)
+    return {"inserted": inserted, "errors": sorted(errors, key=lambda error: error["row"])}
+
+
+@app.post("/marks/bulk")
+async def enter_marks_bulk(request:Request, db:db_dependency, batch_size:Annotated[int, Query(ge=1, le=10000)]=BULK_BATCH):
+    # JSON array or CSV (student_id,sub1,sub2,sub3)
+    entries, errors = validate_rows(await read_rows(request), MarksEntry)
+    inserted = await db.run_sync(insert_marks, entries, errors, batch_size)
+    return {"inserted": inserted, "errors": sorted(errors, key=lambda error: error["row"])}
 
 # @app.delete("/delete/{student_id}")
 # async def deleteStu(student_id:int, db:db_dependency):
@@ -80,56 +108,32 @@ async def enter_student_marks(student_id:int, marks:Marks, db:db_dependency):
 
 @app.get("/reportt")
 async def get_report(db:db_dependency):
-    #db = SessionLocal()
-    
-    # Calculate the highest overall score
-    highest_score = db.query(models.Marks.student_id, func.sum(models.Marks.sub1 + models.Marks.sub2 + models.Marks.sub3).label("overall_score")).group_by(models.Marks.student_id).order_by(func.sum(models.Marks.sub1 + models.Marks.sub2 + models.Marks.sub3).desc()).first()
-    students = db.query(models.Student).all()
-
-    # Create a list to store the grades for each student and subject
-    student_grades = []
-
-    for student in students:
-        # Retrieve the marks for the current student
-        marks = db.query(models.Marks).filter(models.Marks.student_id == student.roll_no).first()
-
-        if marks:
-            # Calculate grades for each subject
-            sub1_grade = calculate_grade(marks.sub1)
-            sub2_grade = calculate_grade(marks.sub2)
-            sub3_grade = calculate_grade(marks.sub3)
-
-            # Create a dictionary to store the grades for the current student
-            student_grade_data = {
-                "student_id": student.roll_no,
-                "name": student.name,
-                "sub1_grade": sub1_grade,
-                "sub2_grade": sub2_grade,
-                "sub3_grade": sub3_grade,
-            }
-
-            student_grades.append(student_grade_data)
-
-    if highest_score:
-        student_id, overall_score = highest_score
-        # Retrieve the student's details (name, etc.) if needed
-        student = db.query(models.Student).filter(models.Student.roll_no == student_id).first()
-        return {"student_id": student_id, "overall_score": overall_score, "student_name": student.name if student else None}, student_grades
-    else:
-        return {"message": "No data found"}
-
-
-def calculate_grade(score):
-    if score > 90:
-        return 'A'
-    elif 80 <= score <= 90:
-        return 'B'
-    elif 70 <= score < 80:
-        return 'C'
-    elif 50 <= score < 70:
-        return 'D'
-    else:
-        return 'F'  # Fail or another suitable grade
+    # Grades and the highest overall score come from one aggregated query (report.py)
+    return await db.run_sync(build_report)
+
+
+@app.get("/reportt/page")
+async def get_report_page(db:db_dependency, after:int|None=None, limit:Annotated[int, Query(ge=1, le=1000)]=100):
+    # Keyset pagination on roll_no: pass the `next` of a page as `after` for the one after it
+    return await db.run_sync(report_page, after, limit)
+
+
+@app.get("/reportt/top")
+async def get_top_scores(db:db_dependency, n:Annotated[int, Query(ge=1, le=100)]=10):
+    # Highest overall scores, read from the maintained student_totals
+    return await db.run_sync(top_scores, n)
+
+
+@app.get("/reportt/grades")
+async def get_grade_distribution(db:db_dependency):
+    return await db.run_sync(grade_distribution)
+
+
+@app.get("/reportt/stream")
+async def get_report_stream():
+    # NDJSON, one student per line and the top scorer last, sent as rows are fetched;
+    # the generator uses a sync session and is iterated in a worker thread
+    return StreamingResponse(stream_report(SessionLocal), media_type="application/x-ndjson")
 
 
 # @app.get("/grades")
@@ -15,4 +15,23 @@ class Marks(Base):
     sub1= Column(Float, index=True)
     sub2= Column(Float, index=True)
     sub3= Column(Float, index=True)
-    student_id=Column(Integer, ForeignKey("student_info.roll_no"))
\ No newline at end of file
+    student_id=Column(Integer, ForeignKey("student_info.roll_no"))
+
+
+class StudentTotal(Base):
+    __tablename__='student_totals'
+
+    # Kept up to date by aggregates.py as marks are entered
+    student_id=Column(Integer, ForeignKey("student_info.roll_no"), primary_key=True)
+    overall_score=Column(Float, index=True)
+    marks_count=Column(Integer, nullable=False)
+    first_marks_id=Column(Integer, ForeignKey("marks.id"))
+
+
+class GradeCount(Base):
+    __tablename__='grade_counts'
+
+    # Students per grade of each subject, graded on their first marks
+    subject=Column(String, primary_key=True)
+    grade=Column(String, primary_key=True)
+    students=Column(Integer, nullable=False)
\ No newline at end of file
@@ -0,0 +1,116 @@
+import json
+from sqlalchemy import case, func
+import models
+
+# Rows fetched per round trip from the server-side cursor of the streamed report
+STREAM_BATCH = 1000
+
+
+def calculate_grade(score):
+    if score > 90:
+        return 'A'
+    elif 80 <= score <= 90:
+        return 'B'
+    elif 70 <= score < 80:
+        return 'C'
+    elif 50 <= score < 70:
+        return 'D'
+    else:
+        return 'F'  # Fail or another suitable grade
+
+
+def grade(score):
+    # calculate_grade() as a SQL CASE, so grades come back with the rows
+    return case(
+        (score > 90, "A"),
+        (score >= 80, "B"),
+        (score >= 70, "C"),
+        (score >= 50, "D"),
+        else_="F",
+    )
+
+
+def overall_score():
+    return func.sum(models.Marks.sub1 + models.Marks.sub2 + models.Marks.sub3)
+
+
+def report_query(db, after=None):
+    # One row per student with marks, in roll_no order: roll_no, name, the grades of
+    # the student's first marks row and the overall score summed over all of them.
+    # Both come from student_totals (aggregates.py), so the marks table is only read
+    # for the graded rows. `after` is a keyset cursor: only students with a larger
+    # roll_no are reported.
+    query = db.query(
+        models.Student.roll_no,
+        models.Student.name,
+        grade(models.Marks.sub1).label("sub1_grade"),
+        grade(models.Marks.sub2).label("sub2_grade"),
+        grade(models.Marks.sub3).label("sub3_grade"),
+        models.StudentTotal.overall_score,
+    ).join(
+        models.StudentTotal, models.StudentTotal.student_id == models.Student.roll_no
+    ).join(
+        models.Marks, models.Marks.id == models.StudentTotal.first_marks_id
+    )
+    if after is not None:
+        query = query.filter(models.Student.roll_no > after)
+    return query.order_by(models.Student.roll_no)
+
+
+def student_grade(row) -> dict:
+    return {
+        "student_id": row.roll_no,
+        "name": row.name,
+        "sub1_grade": row.sub1_grade,
+        "sub2_grade": row.sub2_grade,
+        "sub3_grade": row.sub3_grade,
+    }
+
+
+def top_scorer(top, row):
+    if row.overall_score is not None and (top is None or row.overall_score > top.overall_score):
+        return row
+    return top
+
+
+def summary(top) -> dict:
+    if top is None:
+        return {"message": "No data found"}
+    return {"student_id": top.roll_no, "overall_score": top.overall_score, "student_name": top.name}
+
+
+def build_report(db):
+    student_grades = []
+    top = None
+    for row in report_query(db):
+        student_grades.append(student_grade(row))
+        # The top scorer falls out of the same pass, no second query needed
+        top = top_scorer(top, row)
+
+    if top is None:
+        return summary(None)
+    return summary(top), student_grades
+
+
+def report_page(db, after=None, limit=100) -> dict:
+    # A page of the report starting after roll_no `after`; `next` is the cursor for
+    # the following page, None on the last one
+    rows = report_query(db, after).limit(limit).yield_per(limit)
+    student_grades = [student_grade(row) for row in rows]
+    following = student_grades[-1]["student_id"] if len(student_grades) == limit else None
+    return {"student_grades": student_grades, "next": following}
+
+
+def stream_report(session_factory, batch=STREAM_BATCH):
+    # The report as NDJSON: one line per student while the rows arrive from a
+    # server-side cursor, then the top scorer line once they have all been seen.
+    # Opens its own session, since it runs after the handler has returned.
+    db = session_factory()
+    try:
+        top = None
+        for row in report_query(db).yield_per(batch):
+            yield json.dumps(student_grade(row)) + "\n"
+            top = top_scorer(top, row)
+        yield json.dumps(summary(top)) + "\n"
+    finally:
+        db.close()